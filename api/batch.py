@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from api.scoring import FRAME_COUNT, MAX_SCORE
+
+# numpy is only needed to score games in batches, the API runs without it
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# a game has at most 21 rolls, the rolls of shorter games are padded
+MAX_ROLLS = 2 * FRAME_COUNT + 1
+PADDING = -1
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("batch scoring needs numpy, pip install numpy")
+
+
+# the (N, 21) roll matrix of a list of games, each given as its list of
+# rolls, padded with PADDING
+def roll_matrix(games):
+    _require_numpy()
+    games = list(games)
+    matrix = numpy.full((len(games), MAX_ROLLS), PADDING, dtype=numpy.int16)
+    for row, rolls in enumerate(games):
+        matrix[row, :len(rolls)] = rolls
+    return matrix
+
+
+# score all games of an (N, 21) roll matrix at once, the rolls must be
+# valid games (finished or not) like the ones stored on Game
+# return the final scores, shape (N, ), and the running total up to each
+# frame, shape (N, 10), PADDING for the frames a game has not started,
+# the same numbers Game.calculate_score gives
+# the loop runs over the ten frames, every step works on all games
+def score_games(rolls):
+    _require_numpy()
+    rolls = numpy.asarray(rolls)
+    if rolls.ndim != 2 or rolls.shape[1] != MAX_ROLLS:
+        raise ValueError("expected an (N, %d) roll matrix" % MAX_ROLLS)
+
+    games = numpy.arange(rolls.shape[0])
+    pins = numpy.where(rolls == PADDING, 0, rolls).astype(numpy.int32)
+    start = numpy.zeros(rolls.shape[0], dtype=numpy.intp)
+    frame_scores = numpy.zeros((rolls.shape[0], FRAME_COUNT), dtype=numpy.int32)
+    started = numpy.zeros((rolls.shape[0], FRAME_COUNT), dtype=bool)
+
+    # a frame starts at most at roll 18, so its third ball is always
+    # inside the matrix
+    for frame in xrange(FRAME_COUNT):
+        first = pins[games, start]
+        two_balls = first + pins[games, start + 1]
+        strike = first == MAX_SCORE
+        # strikes and spares score the next balls as well, in the last
+        # frame these are its own bonus balls
+        bonus = strike | (two_balls == MAX_SCORE)
+        frame_scores[:, frame] = numpy.where(
+            bonus, two_balls + pins[games, start + 2], two_balls)
+        started[:, frame] = rolls[games, start] != PADDING
+        start += numpy.where(strike, 1, 2)
+
+    frame_scores[~started] = 0
+    totals = numpy.cumsum(frame_scores, axis=1)
+    totals[~started] = PADDING
+    return frame_scores.sum(axis=1), totals
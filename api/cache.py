@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+
+# entries and locks are shared by all threads of the process,
+# django creates a cache instance per thread
+_caches = {}
+_locks = {}
+
+
+# bounded in-process cache, the least recently used entry is dropped
+# when it is full and entries expire after their timeout
+# values are kept as they are, so they must not be changed once cached
+class LRUCache(BaseCache):
+
+    def __init__(self, name, params):
+        BaseCache.__init__(self, params)
+        self._cache = _caches.setdefault(name, OrderedDict())
+        self._lock = _locks.setdefault(name, threading.Lock())
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            if self._get(key) is not None:
+                return False
+            self._set(key, value, timeout)
+            return True
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            entry = self._get(key)
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._set(key, value, timeout)
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            self._cache.pop(key, None)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        with self._lock:
+            return self._get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    # return the (expiry, value) entry and mark it as used
+    def _get(self, key):
+        entry = self._cache.pop(key, None)
+        if entry is None or (entry[0] is not None and entry[0] <= time.time()):
+            return None
+        self._cache[key] = entry
+        return entry
+
+    def _set(self, key, value, timeout):
+        self._cache.pop(key, None)
+        self._cache[key] = (self.get_backend_timeout(timeout), value)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+
+# cache of the /api/result/ payload per game
+# readers only add entries, writers replace them once their transaction
+# is committed, so a reader that read the game before a write can not
+# put its outdated payload over the fresh one
+class ResultCache(object):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[getattr(settings, 'BOWLING_RESULT_CACHE', 'default')]
+
+    def _key(self, game_id):
+        return 'result:%d' % game_id
+
+    def get(self, game_id):
+        data = self.cache.get(self._key(game_id))
+        with self._lock:
+            if data is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return data
+
+    # return the cached payloads by game id
+    def get_many(self, game_ids):
+        keys = dict((self._key(game_id), game_id) for game_id in game_ids)
+        found = self.cache.get_many(keys.keys())
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return dict((keys[key], data) for key, data in found.items())
+
+    def add(self, game_id, data):
+        self.cache.add(self._key(game_id), data)
+
+    def set(self, game_id, data):
+        self.cache.set(self._key(game_id), data)
+
+    def delete(self, game_id):
+        self.cache.delete(self._key(game_id))
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+results = ResultCache()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import csv
+import heapq
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from api import models
+
+
+FORMATS = ('ndjson', 'csv')
+CSV_COLUMNS = ('game_id', 'create_date', 'update_date', 'is_over',
+               'score', 'rolls', 'frame_scores')
+
+CHUNK_SIZE = 1000
+
+
+# all games ordered by id, archived ones included, read chunk by chunk
+# with keyset pagination (id > last id of the previous chunk), so every
+# chunk costs the same and only one chunk per table is held in memory
+def iter_games(chunk_size=CHUNK_SIZE, after=0):
+    games = ((game.id, game) for game in
+             _iter_rows(models.Game.objects, chunk_size, after))
+    archived = ((game.id, game.as_game()) for game in
+                _iter_rows(models.ArchivedGame.objects, chunk_size, after))
+    for _, game in heapq.merge(games, archived):
+        yield game
+
+
+def _iter_rows(manager, chunk_size, after):
+    while True:
+        rows = list(manager.filter(pk__gt=after).order_by('pk')[:chunk_size])
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1].id
+
+
+# the result of a game in one flat record, scored from its packed rolls
+# so no frames have to be read
+def game_record(game):
+    card = game.score_card()
+    return {
+        'game_id': game.id,
+        'create_date': game.create_date,
+        'update_date': game.update_date,
+        'is_over': game.is_over,
+        'score': game.score,
+        'rolls': card.rolls(),
+        'frame_scores': card.totals
+    }
+
+
+def ndjson_lines(games):
+    for game in games:
+        yield json.dumps(game_record(game), cls=DjangoJSONEncoder) + '\n'
+
+
+# csv.writer wants a file, this one hands back what was written
+class _Line(object):
+    def write(self, value):
+        return value
+
+
+def csv_lines(games):
+    writer = csv.writer(_Line())
+    yield writer.writerow(CSV_COLUMNS)
+    for game in games:
+        record = game_record(game)
+        record['create_date'] = record['create_date'].isoformat()
+        record['update_date'] = record['update_date'].isoformat()
+        record['rolls'] = ' '.join('%d' % score for score in record['rolls'])
+        record['frame_scores'] = ' '.join(
+            '%d' % score for score in record['frame_scores'])
+        yield writer.writerow([record[column] for column in CSV_COLUMNS])
+
+
+def export_lines(output_format, games):
+    if output_format == 'csv':
+        return csv_lines(games)
+    return ndjson_lines(games)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from api import models
+from api.cache import results as result_cache
+
+
+class Command(BaseCommand):
+    help = ("Moves the games finished more than --days days ago from Game "
+            "and Frame to ArchivedGame, batch by batch")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help="archive games finished before this many days")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="games moved per transaction")
+        parser.add_argument('--batches', type=int,
+                            help="stop after this many batches")
+
+    def handle(self, *args, **options):
+        finished_before = timezone.now() - datetime.timedelta(days=options['days'])
+        archived = batches = 0
+        while options['batches'] is None or batches < options['batches']:
+            count = self._archive_batch(finished_before, options['batch_size'])
+            if not count:
+                break
+            archived += count
+            batches += 1
+
+        self.stdout.write("archived %d games" % archived)
+
+    # the oldest finished games first, a batch is read, copied and deleted
+    # in one transaction
+    # finished games can still be corrected, so the games are locked as
+    # they are read: a correction committed before is archived with the
+    # game, a later one finds the game archived
+    # the game with the highest id is kept, some databases hand out the
+    # highest id again once it was deleted
+    # games of matches stay, the standings of a match are read from Game
+    def _archive_batch(self, finished_before, batch_size):
+        newest = models.Game.objects.aggregate(newest=Max('id'))['newest']
+        if newest is None:
+            return 0
+
+        with transaction.atomic():
+            games = list(models.Game.objects.select_for_update().filter(
+                is_over=True, finish_date__lt=finished_before,
+                match__isnull=True, id__lt=newest).order_by('id')[:batch_size])
+            if not games:
+                return 0
+
+            game_ids = [game.id for game in games]
+            models.ArchivedGame.objects.bulk_create(
+                models.ArchivedGame.from_game(game) for game in games)
+            models.Game.objects.filter(id__in=game_ids).delete()
+            transaction.on_commit(lambda: self._drop_results(game_ids))
+        return len(games)
+
+    # the cached results name frames that do not exist anymore
+    def _drop_results(self, game_ids):
+        for game_id in game_ids:
+            result_cache.delete(game_id)
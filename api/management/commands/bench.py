@@ -0,0 +1,236 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries
+from django.test import Client, RequestFactory
+from django.test.utils import (CaptureQueriesContext, setup_test_environment,
+                               teardown_test_environment)
+
+from api import batch
+from api import views
+from api.cache import results as result_cache
+from api.scoring import FRAME_COUNT, MAX_SCORE
+
+
+STRIKE_GAME = [10] * 12
+# nine open frames and a spare in the last frame, 21 rolls
+FULL_GAME = [5, 4] * 9 + [3, 7, 5]
+# games scored per operation of the batch scenario
+BATCH_GAMES = 10000
+
+
+def percentile(timings, fraction):
+    timings = sorted(timings)
+    return timings[min(len(timings) - 1, int(len(timings) * fraction))]
+
+
+# the rolls of a finished game with random pin counts
+def random_game(rng=random):
+    rolls = []
+    for frame in xrange(FRAME_COUNT):
+        first = rng.randint(0, MAX_SCORE)
+        rolls.append(first)
+        if first < MAX_SCORE:
+            rolls.append(rng.randint(0, MAX_SCORE - first))
+        elif frame == FRAME_COUNT - 1:
+            rolls.append(rng.randint(0, MAX_SCORE))
+    # the bonus balls of a strike or spare in the last frame
+    if sum(rolls[-2:]) >= MAX_SCORE:
+        rolls.append(rng.randint(0, MAX_SCORE))
+    return rolls
+
+
+class Command(BaseCommand):
+    help = ("Benchmarks the API views in a throwaway test database and "
+            "compares the numbers against a saved baseline")
+
+    scenarios = ('create', 'strike_game', 'full_game',
+                 'result_poll', 'result_poll_uncached',
+                 'add_view_drf', 'add_view_lean',
+                 'result_view_drf', 'result_view_lean', 'batch_score')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=200,
+                            help="operations per scenario, games for the game "
+                                 "scenarios and ten times as many polls")
+        parser.add_argument('--scenario', action='append', choices=self.scenarios,
+                            help="run only these scenarios")
+        parser.add_argument('--baseline', help="JSON file to compare against")
+        parser.add_argument('--save-baseline', help="JSON file to write the results to")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="allowed loss of ops/sec against the baseline")
+
+    def handle(self, *args, **options):
+        self.client = Client()
+        self.factory = RequestFactory()
+        self.iterations = options['iterations']
+
+        scenarios = options['scenario'] or self.scenarios
+        if batch.numpy is None:
+            if options['scenario'] and 'batch_score' in scenarios:
+                raise CommandError("the batch_score scenario needs numpy")
+            scenarios = [scenario for scenario in scenarios
+                         if scenario != 'batch_score']
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        try:
+            results = dict((scenario, getattr(self, 'bench_' + scenario)())
+                           for scenario in scenarios)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self._report(results)
+
+        if options['save_baseline']:
+            with open(options['save_baseline'], 'w') as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+
+        if options['baseline']:
+            with open(options['baseline']) as baseline:
+                regressions = self._compare(results, json.load(baseline),
+                                            options['threshold'])
+            if regressions:
+                raise CommandError("regressions against the baseline:\n" +
+                                   "\n".join(regressions))
+
+    def _post(self, path, data=None):
+        response = self.client.post(path, json.dumps(data or {}),
+                                    content_type='application/json')
+        return json.loads(response.content.decode('utf-8') or 'null')
+
+    # time every operation and count its queries
+    def _measure(self, operations):
+        timings = []
+        queries = 0
+        for operation in operations:
+            # the query log is bounded, start every operation with an empty one
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.time()
+                operation()
+                timings.append(time.time() - started)
+            queries += len(captured)
+
+        total = sum(timings)
+        return {
+            'ops': len(timings),
+            'ops_per_sec': len(timings) / total if total else 0,
+            'p50_ms': percentile(timings, 0.50) * 1000,
+            'p95_ms': percentile(timings, 0.95) * 1000,
+            'p99_ms': percentile(timings, 0.99) * 1000,
+            'queries_per_op': float(queries) / len(timings),
+        }
+
+    def _new_game(self):
+        return self._post('/api/new/')['game_id']
+
+    def _game_operations(self, scores):
+        for _ in xrange(self.iterations):
+            game_id = self._new_game()
+            for score in scores:
+                yield lambda score=score: self._post(
+                    '/api/add/', {'game_id': game_id, 'score': score})
+
+    def bench_create(self):
+        return self._measure(self._new_game for _ in xrange(self.iterations))
+
+    def bench_strike_game(self):
+        return self._measure(self._game_operations(STRIKE_GAME))
+
+    def bench_full_game(self):
+        return self._measure(self._game_operations(FULL_GAME))
+
+    def _finished_game(self):
+        game_id = self._new_game()
+        for score in FULL_GAME:
+            self._post('/api/add/', {'game_id': game_id, 'score': score})
+        return game_id
+
+    def bench_result_poll(self):
+        game_id = self._finished_game()
+        return self._measure(
+            (lambda: self._post('/api/result/', {'game_id': game_id}))
+            for _ in xrange(self.iterations * 10))
+
+    def bench_result_poll_uncached(self):
+        game_id = self._finished_game()
+
+        def poll():
+            result_cache.delete(game_id)
+            self._post('/api/result/', {'game_id': game_id})
+        return self._measure(poll for _ in xrange(self.iterations * 10))
+
+    # the DRF and the lean views of /api/add/ and /api/result/ called
+    # directly, without urls and middleware, so the difference between
+    # the two is the cost of the view stack alone
+    # a request body is read once, every call gets its own request
+    def _view_call(self, view, path, data):
+        body = json.dumps(data)
+        return lambda: view(self.factory.post(path, body,
+                                              content_type='application/json'))
+
+    def _add_view_operations(self, view):
+        for _ in xrange(self.iterations):
+            game_id = self._new_game()
+            for score in FULL_GAME:
+                yield self._view_call(view, '/api/add/',
+                                      {'game_id': game_id, 'score': score})
+
+    def bench_add_view_drf(self):
+        return self._measure(self._add_view_operations(views.AddScoreView.as_view()))
+
+    def bench_add_view_lean(self):
+        return self._measure(self._add_view_operations(views.add_score))
+
+    # polls of a cached result, no queries at all
+    def _result_view_operations(self, view):
+        game_id = self._finished_game()
+        call = self._view_call(view, '/api/result/', {'game_id': game_id})
+        return (call for _ in xrange(self.iterations * 10))
+
+    def bench_result_view_drf(self):
+        return self._measure(self._result_view_operations(views.GameResultView.as_view()))
+
+    def bench_result_view_lean(self):
+        return self._measure(self._result_view_operations(views.game_result))
+
+    # rescoring BATCH_GAMES finished games from their roll matrix
+    def bench_batch_score(self):
+        rng = random.Random(0)
+        rolls = batch.roll_matrix(random_game(rng) for _ in xrange(BATCH_GAMES))
+        return self._measure(
+            (lambda: batch.score_games(rolls))
+            for _ in xrange(max(1, self.iterations // 10)))
+
+    def _report(self, results):
+        self.stdout.write("%-22s %8s %10s %8s %8s %8s %9s" % (
+            'scenario', 'ops', 'ops/sec', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'))
+        for scenario in sorted(results):
+            result = results[scenario]
+            self.stdout.write("%-22s %8d %10.1f %8.2f %8.2f %8.2f %9.2f" % (
+                scenario, result['ops'], result['ops_per_sec'], result['p50_ms'],
+                result['p95_ms'], result['p99_ms'], result['queries_per_op']))
+
+    # slower by more than the threshold or more queries per operation
+    def _compare(self, results, baseline, threshold):
+        regressions = []
+        for scenario in sorted(results):
+            if scenario not in baseline:
+                continue
+            result, before = results[scenario], baseline[scenario]
+            if result['ops_per_sec'] < before['ops_per_sec'] * (1 - threshold):
+                regressions.append("%s: %.1f ops/sec, baseline %.1f" % (
+                    scenario, result['ops_per_sec'], before['ops_per_sec']))
+            if result['queries_per_op'] > before['queries_per_op']:
+                regressions.append("%s: %.2f queries per operation, baseline %.2f" % (
+                    scenario, result['queries_per_op'], before['queries_per_op']))
+        return regressions
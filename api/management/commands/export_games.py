@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from api import export
+
+
+class Command(BaseCommand):
+    help = "Streams the results of all games as NDJSON or CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=export.FORMATS, default='ndjson')
+        parser.add_argument('--output', help="file to write to, stdout by default")
+        parser.add_argument('--chunk-size', type=int, default=export.CHUNK_SIZE)
+        parser.add_argument('--after', type=int, default=0,
+                            help="only export games with a higher id")
+
+    def handle(self, *args, **options):
+        games = export.iter_games(options['chunk_size'], options['after'])
+        lines = export.export_lines(options['format'], games)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                for line in lines:
+                    output.write(line)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import multiprocessing
+import re
+import time
+from collections import Counter, defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api import models
+from api.views import parse_date_argument
+from api.scoring import (ScoreCard, GameOverException, InvalidScoreException,
+                         OVER, validate_rolls)
+from api.statistics import card_counts
+
+
+ERROR_NOT_A_NUMBER = "Rolls have to be numbers"
+ERROR_NOT_FINISHED = "The game is not finished"
+ERROR_INVALID_DATE = "Invalid date"
+
+# a line may start with the date the game was played
+DATE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+# score one line of the file, runs in the worker processes
+# return (line number, card, finish date or None, error message)
+def score_line(numbered_line):
+    line_number, line = numbered_line
+    fields = re.split(r'[\s,]+', line.strip())
+    finish_date = None
+    if DATE.match(fields[0]):
+        try:
+            finish_date = parse_date_argument(fields.pop(0))
+        except ValueError:
+            return line_number, None, None, ERROR_INVALID_DATE
+
+    try:
+        rolls = [int(score) for score in fields]
+    except ValueError:
+        return line_number, None, None, ERROR_NOT_A_NUMBER
+
+    # only valid games are scored
+    try:
+        state = validate_rolls(rolls)
+    except (InvalidScoreException, GameOverException) as e:
+        return line_number, None, None, e.message
+
+    if state != OVER:
+        return line_number, None, None, ERROR_NOT_FINISHED
+    return line_number, ScoreCard.from_rolls(rolls), finish_date, None
+
+
+class Command(BaseCommand):
+    help = ("Imports finished games from a file with the rolls of one game "
+            "per line, separated by spaces or commas, optionally after the "
+            "date the game was played (2018-09-01 or 2018-09-01T16:20:00). "
+            "The date is the finish date of the game and its rolls are "
+            "counted in the statistics of that day, not of the day of the "
+            "import; games without a date take --date, without it they have "
+            "no finish date and only count in the score distribution")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--workers', type=int,
+                            default=multiprocessing.cpu_count())
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="games written per bulk insert")
+        parser.add_argument('--packed', action='store_true',
+                            help="store packed games without Frame rows")
+        parser.add_argument('--date',
+                            help="the date of the games without one")
+
+    def handle(self, *args, **options):
+        started = time.time()
+        self.imported = self.invalid = self.rolls = 0
+        self.packed = options['packed']
+        try:
+            default_date = parse_date_argument(options['date'])
+        except ValueError:
+            raise CommandError("%s: %s" % (ERROR_INVALID_DATE, options['date']))
+
+        try:
+            lines = open(options['path'])
+        except IOError as e:
+            raise CommandError(e)
+
+        pool = multiprocessing.Pool(options['workers'])
+        try:
+            numbered = ((number, line) for number, line in enumerate(lines, 1)
+                        if line.strip() and not line.startswith('#'))
+            batch = []
+            for line_number, card, finish_date, error in pool.imap(
+                    score_line, numbered, chunksize=256):
+                if error:
+                    self.invalid += 1
+                    self.stderr.write("line %d: %s" % (line_number, error))
+                    continue
+
+                batch.append((card, finish_date or default_date))
+                if len(batch) == options['batch_size']:
+                    self._write(batch)
+                    batch = []
+            self._write(batch)
+        finally:
+            pool.terminate()
+            lines.close()
+
+        elapsed = max(time.time() - started, 1e-6)
+        self.stdout.write(
+            "imported %d games (%d rolls), %d invalid, in %.2fs: "
+            "%.0f games/s, %.0f rolls/s" % (
+                self.imported, self.rolls, self.invalid, elapsed,
+                self.imported / elapsed, self.rolls / elapsed))
+
+    # the statistics are counted per day the games were played, games
+    # without a date are only counted in the score distribution
+    def _write(self, batch):
+        if not batch:
+            return
+
+        games, cards, undated = [], [], []
+        days = defaultdict(lambda: (Counter(), []))
+        for card, finish_date in batch:
+            game = models.Game(is_packed=self.packed)
+            game._set_score(card, finish_date)
+            games.append(game)
+            cards.append(card)
+
+            if finish_date is None:
+                undated.append(card.total)
+                continue
+            counts, final_scores = days[timezone.localdate(finish_date)]
+            counts.update(card_counts(card))
+            final_scores.append(card.total)
+
+        with transaction.atomic():
+            self._insert(games)
+            models.drop_cached_results(games)
+            if not self.packed:
+                self._write_frames(games, cards)
+            for day, (counts, final_scores) in days.items():
+                models.record_statistics(counts, final_scores, day=day)
+            models.record_score_distribution(undated)
+
+        self.imported += len(cards)
+        self.rolls += sum(len(card.rolls()) for card in cards)
+
+    # the frames and the cached results need the ids of the games, which
+    # only some databases hand back from a bulk insert
+    def _insert(self, games):
+        if connection.features.can_return_ids_from_bulk_insert:
+            models.Game.objects.bulk_create(games)
+        else:
+            for game in games:
+                game.save()
+
+    def _write_frames(self, games, cards):
+        frames = []
+        for game, card in zip(games, cards):
+            frames.extend(game._fill_frame(models.Frame(game=game), card, index)
+                          for index in xrange(len(card.frames)))
+        models.Frame.objects.bulk_create(frames)
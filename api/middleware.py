@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger('api.timing')
+
+
+# records per request the number of SQL queries, the time spent in the
+# database, in the view and in rendering the response, and sends them
+# as Server-Timing header and as a log line
+# opt-in: add 'api.middleware.TimingMiddleware' to MIDDLEWARE, only
+# BOWLING_TIMING_SAMPLE_RATE of the requests are recorded
+class TimingMiddleware(object):
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'BOWLING_TIMING_SAMPLE_RATE', 1.0)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        # queries are only logged with DEBUG on or a forced debug cursor,
+        # django empties the log when a request starts
+        debug_cursors = {}
+        logged = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+            logged[connection.alias] = len(connection.queries_log)
+
+        request.timing = {}
+        started = time.time()
+        try:
+            response = self.get_response(request)
+        finally:
+            finished = time.time()
+            queries = []
+            for connection in connections.all():
+                if connection.alias in debug_cursors:
+                    connection.force_debug_cursor = debug_cursors[connection.alias]
+                queries.extend(list(connection.queries_log)[
+                    logged.get(connection.alias, 0):])
+
+        timing = self._timing(request.timing, started, finished, queries)
+        response['Server-Timing'] = self._header(timing)
+        logger.info(
+            "%s %s status=%d queries=%d db_ms=%.2f view_ms=%.2f "
+            "serialize_ms=%.2f total_ms=%.2f",
+            request.method, request.path, response.status_code,
+            timing['queries'], timing['db'], timing['view'],
+            timing['serialize'], timing['total'],
+            extra=dict(timing, method=request.method, path=request.path,
+                       status=response.status_code))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if hasattr(request, 'timing'):
+            request.timing['view_started'] = time.time()
+
+    # called with the view's response before it is rendered
+    def process_template_response(self, request, response):
+        if hasattr(request, 'timing'):
+            request.timing['view_finished'] = time.time()
+        return response
+
+    # all times in milliseconds, responses that are not rendered after
+    # the view count as view time only
+    def _timing(self, timing, started, finished, queries):
+        view_started = timing.get('view_started', started)
+        view_finished = timing.get('view_finished', finished)
+        return {
+            'queries': len(queries),
+            'db': sum(float(query['time']) for query in queries) * 1000,
+            'view': (view_finished - view_started) * 1000,
+            'serialize': (finished - view_finished) * 1000,
+            'total': (finished - started) * 1000,
+        }
+
+    def _header(self, timing):
+        return ', '.join([
+            'db;dur=%.2f;desc="%d queries"' % (timing['db'], timing['queries']),
+            'view;dur=%.2f' % timing['view'],
+            'serialize;dur=%.2f' % timing['serialize'],
+            'total;dur=%.2f' % timing['total'],
+        ])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:03
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from api.scoring import ScoreCard
+
+
+def fill_running_totals(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    Frame = apps.get_model('api', 'Frame')
+    for game in Game.objects.iterator():
+        frames = list(game.frames.order_by('id'))
+        card = ScoreCard.from_rolls(
+            [score for frame in frames
+             for score in (frame.score_one, frame.score_two, frame.score_three)
+             if score is not None])
+
+        # update() keeps the update_date of the rows as they are
+        for index, frame in enumerate(frames):
+            Frame.objects.filter(pk=frame.pk).update(
+                score=card.totals[index], is_settled=card.settled[index])
+        Game.objects.filter(pk=game.pk).update(score=card.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_auto_20180901_1626'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='is_settled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='frame',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_running_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:04
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_running_totals'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='frame',
+            options={'ordering': ('id',)},
+        ),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:06
+from __future__ import unicode_literals
+
+import api.models
+from django.db import migrations, models
+
+from api.scoring import pack_rolls
+
+
+def fill_rolls(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    for game in Game.objects.iterator():
+        rolls = [score for frame in game.frames.order_by('id')
+                 for score in (frame.score_one, frame.score_two, frame.score_three)
+                 if score is not None]
+        # update() keeps the update_date of the row as it is
+        Game.objects.filter(pk=game.pk).update(rolls=pack_rolls(rolls))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_game_version'),
+    ]
+
+    operations = [
+        # existing games have their frames stored, whatever the setting says
+        migrations.AddField(
+            model_name='game',
+            name='is_packed',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AlterField(
+            model_name='game',
+            name='is_packed',
+            field=models.BooleanField(default=api.models._is_packed_default),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='rolls',
+            field=models.CharField(blank=True, default='', max_length=21),
+        ),
+        migrations.RunPython(fill_rolls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:08
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_final_scores(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    Game.objects.filter(is_over=True).update(
+        final_score=F('score'), finish_date=F('update_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_packed_rolls'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='final_score',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='game',
+            name='finish_date',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['final_score', 'finish_date'], name='api_game_final_s_91eac6_idx'),
+        ),
+        migrations.RunPython(fill_final_scores, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 19:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+# number the frames of every game in the order they were created
+def fill_frame_numbers(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    Frame = apps.get_model('api', 'Frame')
+    for game_id in Game.objects.values_list('id', flat=True).iterator():
+        frame_ids = Frame.objects.filter(game_id=game_id).order_by('id') \
+            .values_list('id', flat=True)
+        for number, frame_id in enumerate(frame_ids, 1):
+            Frame.objects.filter(id=frame_id).update(frame_number=number)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_leaderboard'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='frame_number',
+            field=models.IntegerField(null=True),
+        ),
+        migrations.RunPython(fill_frame_numbers, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='frame',
+            name='frame_number',
+            field=models.IntegerField(),
+        ),
+        migrations.AlterModelOptions(
+            name='frame',
+            options={'ordering': ('frame_number',)},
+        ),
+        migrations.AlterUniqueTogether(
+            name='frame',
+            unique_together=set([('game', 'frame_number')]),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:20
+from __future__ import unicode_literals
+
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+from api.scoring import ScoreCard, unpack_rolls
+from api.statistics import card_counts
+
+
+# count the rolls of the existing games, on the day each game was last
+# played, the days of the earlier rolls are not known
+def fill_statistics(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    DailyStatistics = apps.get_model('api', 'DailyStatistics')
+    ScoreDistribution = apps.get_model('api', 'ScoreDistribution')
+
+    days = defaultdict(Counter)
+    final_scores = Counter()
+    for game in Game.objects.exclude(rolls='').iterator():
+        card = ScoreCard.from_rolls(unpack_rolls(game.rolls))
+        counts = days[timezone.localtime(game.update_date).date()]
+        counts.update(card_counts(card))
+        if card.is_over:
+            counts.update(games_finished=1, final_score_total=card.total)
+            final_scores[card.total] += 1
+
+    DailyStatistics.objects.bulk_create(
+        DailyStatistics(day=day, **counts) for day, counts in days.items())
+    ScoreDistribution.objects.bulk_create(
+        ScoreDistribution(score=score, games=games)
+        for score, games in final_scores.items())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_frame_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('rolls', models.BigIntegerField(default=0)),
+                ('first_balls', models.BigIntegerField(default=0)),
+                ('first_ball_pins', models.BigIntegerField(default=0)),
+                ('strikes', models.BigIntegerField(default=0)),
+                ('spare_chances', models.BigIntegerField(default=0)),
+                ('spares', models.BigIntegerField(default=0)),
+                ('games_finished', models.BigIntegerField(default=0)),
+                ('final_score_total', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ScoreDistribution',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(unique=True)),
+                ('games', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('score',),
+            },
+        ),
+        migrations.RunPython(fill_statistics, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:27
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+# which version changed a stored frame is not known, the version of its
+# game is the safe guess, a client polling with an older version gets
+# the frame again
+def fill_frame_versions(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    Frame = apps.get_model('api', 'Frame')
+    Frame.objects.update(version=Subquery(
+        Game.objects.filter(pk=OuterRef('game_id')).values('version')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frame',
+            name='version',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(fill_frame_versions, migrations.RunPython.noop),
+    ]
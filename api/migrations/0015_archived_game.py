@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:30
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_frame_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedGame',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('final_score', models.IntegerField()),
+                ('rolls', models.CharField(max_length=21)),
+                ('frame_scores', models.CharField(max_length=39)),
+                ('version', models.IntegerField()),
+                ('create_date', models.DateTimeField()),
+                ('finish_date', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedgame',
+            index=models.Index(fields=['final_score', 'finish_date'], name='api_archive_final_s_a67762_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 18:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_archived_game'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['create_date', 'id'], name='api_game_create__126ffd_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['is_over', 'create_date', 'id'], name='api_game_is_over_b6ae93_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedgame',
+            index=models.Index(fields=['create_date', 'id'], name='api_archive_create__046665_idx'),
+        ),
+    ]
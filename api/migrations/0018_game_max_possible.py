@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.15 on 2026-10-18 19:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from api.scoring import ScoreCard, unpack_rolls
+
+
+def fill_max_possible(apps, schema_editor):
+    Game = apps.get_model('api', 'Game')
+    for game in Game.objects.exclude(rolls='').iterator():
+        card = ScoreCard.from_rolls(unpack_rolls(game.rolls))
+        # update() keeps the update_date of the row as it is
+        Game.objects.filter(pk=game.pk).update(max_possible=card.max_possible)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0017_match'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='max_possible',
+            field=models.IntegerField(default=300),
+        ),
+        migrations.RunPython(fill_max_possible, migrations.RunPython.noop),
+    ]
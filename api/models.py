@@ -1,23 +1,37 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import models
+from collections import Counter
 
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
 
-class GameOverException(Exception):
-    message = "The Game is already finished"
+from api import pubsub
+from api.cache import results as result_cache
+from api.scoring import (GameOverException, InvalidScoreException,
+                         ScoreCard, FRAME_COUNT, LAST_FRAME, MAX_SCORE,
+                         pack_rolls, split_frames, unpack_rolls)
+from api.statistics import COUNTERS, card_counts, counts_since
 
 
-class InvalidScoreException(Exception):
-    message = "Invalid score."
+class ConcurrentUpdateException(Exception):
+    message = "The game was changed at the same time, please try again."
 
 
-MAX_SCORE = 10
-MIN_SCORE = 0
+class InvalidRollPositionException(Exception):
+    message = "Invalid roll position."
+
+
+# how often a write is retried when another write to the same game won
+MAX_WRITE_RETRIES = 5
 
 
 class Frame(models.Model):
     game = models.ForeignKey('Game', related_name='frames')
+    # 1 to 10
+    frame_number = models.IntegerField()
     create_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(auto_now=True)
 
@@ -29,158 +43,686 @@ class Frame(models.Model):
     score_two = models.IntegerField(null=True, blank=True)
     score_three = models.IntegerField(null=True, blank=True)
 
+    # running total of the game up to this frame
+    score = models.IntegerField(default=0)
+    # no strike or spare bonus is missing anymore
+    is_settled = models.BooleanField(default=False)
+    # the version of the game that last changed the frame, see
+    # Game.version
+    version = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ('frame_number', )
+        unique_together = ('game', 'frame_number')
+
     def as_dict(self):
         return {'frame_id': self.id,
+                'frame_number': self.frame_number,
                 'is_spare': self.is_spare,
                 'is_strike': self.is_strike,
                 'is_last_frame': self.is_last_frame,
                 'score': self.score,
+                'is_settled': self.is_settled,
+                'version': self.version,
                 'score_one': self.score_one,
                 'score_two': self.score_two,
                 'score_three': self.score_three
         }
 
-    def get_score_one(self):
-        return self.score_one or 0
-
-    def get_frame_score(self):
-        return sum([self.score_one or 0,
-                    self.score_two or 0,
-                    self.score_three or 0])
+    def get_rolls(self):
+        return [score for score in (self.score_one,
+                                    self.score_two,
+                                    self.score_three) if score is not None]
 
-    def get_frame_score_for_strike(self):
-        return sum([self.score_one or 0,
-                    self.score_two or 0])
 
-    def is_closed(self):
-        return not self.is_last_frame and (self.is_strike or self._is_two_times_played())
-
-    def _is_two_times_played(self):
-        return self.score_one is not None and self.score_two is not None
+# new games keep their rolls on the game row only, see Game.is_packed
+def _is_packed_default():
+    return getattr(settings, 'BOWLING_PACKED_ROLLS', False)
 
 
 class Game(models.Model):
     is_over = models.BooleanField(default=False)
+    score = models.IntegerField(default=0)
+    # the highest final score the game can still reach, a new game can
+    # still become a perfect one
+    max_possible = models.IntegerField(default=FRAME_COUNT * 3 * MAX_SCORE)
+    # bumped on every write, see _save_score
+    version = models.IntegerField(default=0)
+
+    # all rolls of the game, packed by scoring.pack_rolls
+    rolls = models.CharField(max_length=21, blank=True, default='')
+    # packed games do not write Frame rows, their frames are derived
+    # from the rolls when they are read
+    is_packed = models.BooleanField(default=_is_packed_default)
+
+    # set once the game is over, for the leaderboard
+    final_score = models.IntegerField(null=True, blank=True)
+    finish_date = models.DateTimeField(null=True, blank=True)
+
+    # the games of a match, one per bowler in bowler order
+    match = models.ForeignKey('Match', null=True, blank=True,
+                              related_name='games', on_delete=models.CASCADE)
+    bowler = models.CharField(max_length=50, blank=True, default='')
+    position = models.PositiveSmallIntegerField(null=True, blank=True)
 
     create_date = models.DateTimeField(auto_now_add=True)
     update_date = models.DateTimeField(auto_now=True)
 
-    def as_dict(self, score=0):
+    class Meta:
+        unique_together = ('match', 'position')
+        indexes = [
+            models.Index(fields=['final_score', 'finish_date']),
+            models.Index(fields=['create_date', 'id']),
+            models.Index(fields=['is_over', 'create_date', 'id']),
+        ]
+
+    @classmethod
+    def create(cls, **fields):
+        game = cls.objects.create(**fields)
+        drop_cached_results([game])
+        return game
+
+    def as_dict(self):
         return {
             'game_id': self.id,
             'is_over': self.is_over,
-            'score': score
+            'score': self.score,
+            'version': self.version
         }
 
-    def add_score(self, score):
-        if self.is_over:
-            raise GameOverException()
+    # the finished games with the best final scores, best first, optionally
+    # only the games finished within [since, until)
+    # walks the (final_score, finish_date) index from the top
+    # archived games included
+    @classmethod
+    def leaderboard(cls, limit, since=None, until=None):
+        games = cls.objects.filter(final_score__isnull=False)
+        archived = ArchivedGame.objects.all()
+        if since is not None:
+            games = games.filter(finish_date__gte=since)
+            archived = archived.filter(finish_date__gte=since)
+        if until is not None:
+            games = games.filter(finish_date__lt=until)
+            archived = archived.filter(finish_date__lt=until)
+
+        order = ('-final_score', 'finish_date', 'id')
+        games = list(games.order_by(*order)[:limit]) + [
+            game.as_game() for game in archived.order_by(*order)[:limit]]
+        # games imported without a date have no finish date
+        games.sort(key=lambda game: (-game.final_score, game.finish_date is not None,
+                                     game.finish_date, game.id))
+        return games[:limit]
+
+    # one page of games, newest first, optionally only the running
+    # (is_over False) or the finished ones, before is the (create_date, id)
+    # of the last game of the previous page
+    # walks the (create_date, id) or (is_over, create_date, id) index from
+    # there, so a page deep down costs the same as the first one
+    # archived games included unless only running games are listed
+    @classmethod
+    def page(cls, limit, is_over=None, before=None):
+        games = cls.objects.all()
+        if is_over is not None:
+            games = games.filter(is_over=is_over)
+
+        order = ('-create_date', '-id')
+        games = list(_before(games, before).order_by(*order)[:limit])
+        if is_over is not False:
+            games += [game.as_game() for game in _before(
+                ArchivedGame.objects.all(), before).order_by(*order)[:limit]]
+        games.sort(key=lambda game: (game.create_date, game.id), reverse=True)
+        return games[:limit]
+
+    def as_summary_dict(self):
+        return {
+            'game_id': self.id,
+            'is_over': self.is_over,
+            'score': self.score,
+            'version': self.version,
+            'create_date': self.create_date,
+            'update_date': self.update_date
+        }
+
+    def as_leaderboard_dict(self):
+        return {
+            'game_id': self.id,
+            'score': self.final_score,
+            'finish_date': self.finish_date
+        }
+
+    # the game and its frames as returned by /api/result/
+    # max_possible and min_guaranteed are the highest and lowest final
+    # score the game can still reach, both stored with the score
+    def result(self):
+        data = self.as_dict()
+        data['max_possible'] = self.max_possible
+        data['min_guaranteed'] = self.score
+        data['frames'] = [frame.as_dict() for frame in self.get_frames()]
+        return data
+
+    def get_frames(self, card=None):
+        if not self.is_packed:
+            return list(self.frames.all())
 
-        if self._is_invalid_score(score):
+        if card is None:
+            card = self.score_card()
+        return [self._fill_frame(Frame(game=self), card, index)
+                for index in xrange(len(card.frames))]
+
+    def score_card(self):
+        return ScoreCard.from_rolls(unpack_rolls(self.rolls))
+
+    def add_score(self, score):
+        for _ in xrange(MAX_WRITE_RETRIES):
+            if self._try_add_score(score):
+                return
+            # somebody else added a score in between, start over
+            self.refresh_from_db()
+        raise ConcurrentUpdateException()
+
+    # add the score to the game as it was read, return False if somebody
+    # else changed it in between
+    def _try_add_score(self, score):
+        card = self.score_card()
+        stored_frames = len(card.frames)
+        counts = card_counts(card)
+        card.roll(score)
+
+        with transaction.atomic():
+            if not self._save_score(card):
+                return False
+            self._save_frames(card, card.first_changed, stored_frames)
+            record_statistics_on_commit(counts_since(card, counts),
+                                        [card.total] if card.is_over else [])
+            self._refresh_result()
+        return True
+
+    # replace the roll at position (0 is the first roll) by score, the
+    # later rolls stay, only undo_score removes a roll
+    # the score is checked by the state machine like any other roll
+    def correct_score(self, position, score):
+        if score is None:
+            raise InvalidScoreException()
+        self._change_roll(position, score)
+
+    # remove the roll at position, the last roll by default
+    def undo_score(self, position=None):
+        if position is None:
+            position = len(self.rolls) - 1
+        self._change_roll(position, None)
+
+    def _change_roll(self, position, score):
+        for _ in xrange(MAX_WRITE_RETRIES):
+            if self._try_change_roll(position, score):
+                return
+            # somebody else added a score in between, start over
+            self.refresh_from_db()
+        raise ConcurrentUpdateException()
+
+    # the rolls before position are replayed as they are, only the rolls
+    # from there on are checked again by the state machine, and only the
+    # frames from the first one they change are written: the frame of the
+    # position and the strikes and spares before it still waiting for
+    # their bonus, frames left over by a removed roll are deleted
+    # the statistics get the difference to the rolls before, counted on
+    # today, a final score that changed is moved in the distribution
+    def _try_change_roll(self, position, score):
+        rolls = unpack_rolls(self.rolls)
+        if (isinstance(position, bool) or not isinstance(position, (int, long)) or
+                not 0 <= position < len(rolls)):
+            raise InvalidRollPositionException()
+
+        before = self.score_card()
+        card = ScoreCard.from_rolls(rolls[:position])
+        first_changed = card.pending[0][0] if card.pending else card.frame
+        later = rolls[position + 1:]
+        if score is not None:
+            later.insert(0, score)
+        try:
+            for later_score in later:
+                card.roll(later_score)
+        except GameOverException:
+            # the game would be over before the later rolls
             raise InvalidScoreException()
 
-        prev_frame = self.frames.last()
-
-        # there is no frame yet 
-        # or the previous frame is already closed, 
-        if prev_frame is None or (prev_frame and prev_frame.is_closed()): 
-            self._create_new_frame(score)
-
-        # we are playing in the last frame and we have either a spare or a strike
-        elif prev_frame.is_last_frame and (prev_frame.is_strike or prev_frame.is_spare):
-            self._add_score_for_last_frame(prev_frame, score)
-           
-        # the ordinary second shot 
-        else:
-            if prev_frame.score_one + score > MAX_SCORE:
-                raise InvalidScoreException()
-
-            self._add_score_for_second_ball(prev_frame, score)
-
-    def _is_invalid_score(self, score):
-        return score < MIN_SCORE or score > MAX_SCORE or not isinstance(score, (int, long))
-
-    # create a new frame
-    # check if it's the last frame and if there is a strike
-    # and add the score
-    def _create_new_frame(self, score):
-        Frame.objects.create(
-            game=self,
-            score_one=score,
-            is_strike=self._is_strike(score),
-            is_last_frame=self._adding_last_frame()
-        )
-
-    # last frame and there was a strike or spare
-    # if it's round three add and close the game
-    # otherwise leave the game open
-    def _add_score_for_last_frame(self, frame, score):
-        if frame.score_two is None:
-            frame.score_two = score
-            frame.save()
-        else:
-            frame.score_three = score
+        # a corrected game that was over already keeps its finish date,
+        # see _set_score
+        with transaction.atomic():
+            if not self._save_score(card):
+                return False
+            self._save_frames(card, first_changed, len(before.frames))
+            if not self.is_packed and len(card.frames) < len(before.frames):
+                self.frames.filter(frame_number__gt=len(card.frames)).delete()
+            record_statistics_on_commit(counts_since(card, card_counts(before)),
+                                        [card.total] if card.is_over else [],
+                                        [before.total] if before.is_over else [])
+            self._refresh_result()
+        return True
+
+    def _set_score(self, card, update_date):
+        self.score = card.total
+        self.max_possible = card.max_possible
+        self.is_over = card.is_over
+        self.rolls = pack_rolls(card.rolls())
+        self.final_score = card.total if card.is_over else None
+        self.finish_date = (self.finish_date or update_date) if card.is_over else None
+        self.update_date = update_date
+
+    # write the new score only if the game is still at the version the
+    # rolls were read at, concurrent writers to the same game thereby
+    # never both win while writes to other games are not held up
+    # return False if somebody else changed the game in between
+    def _save_score(self, card):
+        version = self.version
+        self._set_score(card, timezone.now())
+        updated = Game.objects.filter(pk=self.pk, version=version).update(
+            version=F('version') + 1,
+            score=self.score,
+            max_possible=self.max_possible,
+            is_over=self.is_over,
+            rolls=self.rolls,
+            final_score=self.final_score,
+            finish_date=self.finish_date,
+            update_date=self.update_date)
+        if not updated:
+            return False
+
+        self.version += 1
+        return True
+
+    # drop the cached result right away, put the new one in place and
+    # send it to the streams of the game once the write is committed
+    def _refresh_result(self):
+        result_cache.delete(self.id)
+        transaction.on_commit(self._publish_result)
+
+    def _publish_result(self):
+        data = self.result()
+        result_cache.set(self.id, data)
+        pubsub.broker().publish(self.id, data)
+
+    def _save_frames(self, card, first_changed, stored_frames):
+        created, changed = self._changed_frames(card, first_changed, stored_frames)
+        for frame in created:
             frame.save()
-            self.is_over = True
-            self.save()
-
-    # check if it is a spare and if it's the last frame 
-    # and it's not a spare the game is over
-    def _add_score_for_second_ball(self, frame, score):
-        frame.score_two = score
-        frame.is_spare = self._is_spare(frame.score_one, score)
-        frame.save()
-
-        if frame.is_last_frame and not frame.is_spare:
-            self.is_over = True
-            self.save()
-
-    def _adding_last_frame(self):
-        return self.frames.count() == MAX_SCORE - 1 
-    
-    def _is_strike(self, score):
-        if score == MAX_SCORE:
-            return True
-        return False
-
-    def _is_spare(self, score_one, score_two):
-        if score_one + score_two == MAX_SCORE:
-            return True
-        return False
+        self._update_frames(changed)
+
+    # the frames from the first changed one on, that is the frame the last
+    # roll went into and the frames still waiting for a bonus
+    # stored_frames is the number of frames stored before the rolls
+    # return the new frames, still unsaved, and the fields of the changed
+    # stored frames
+    def _changed_frames(self, card, first_changed, stored_frames):
+        created, changed = [], []
+        if self.is_packed:
+            return created, changed
+
+        for index in xrange(first_changed, len(card.frames)):
+            if index < stored_frames:
+                changed.append(self._frame_fields(card, index))
+            else:
+                created.append(self._fill_frame(Frame(game=self), card, index))
+        return created, changed
+
+    # stored frames are found by the unique (game, frame_number) index,
+    # there is no need to read them first
+    def _update_frames(self, changed):
+        update_date = timezone.now()
+        for fields in changed:
+            Frame.objects.filter(
+                game=self, frame_number=fields['frame_number']).update(
+                    update_date=update_date, **fields)
+
+    # frames carry the version of the game that wrote them, the frames
+    # of packed games are derived on every read and so carry the
+    # current version
+    def _frame_fields(self, card, index):
+        rolls = card.frames[index] + [None] * (3 - len(card.frames[index]))
+        return {
+            'frame_number': index + 1,
+            'score_one': rolls[0],
+            'score_two': rolls[1],
+            'score_three': rolls[2],
+            'is_last_frame': index == LAST_FRAME,
+            'is_strike': card.is_strike(index),
+            'is_spare': card.is_spare(index),
+            'score': card.totals[index],
+            'is_settled': card.settled[index],
+            'version': self.version,
+        }
+
+    def _fill_frame(self, frame, card, index):
+        for name, value in self._frame_fields(card, index).items():
+            setattr(frame, name, value)
+        return frame
 
     # calculate the total score and also the score of each frame
     # return score and a list of frames with score attribute per frame
     def calculate_score(self):
-        frame_list = [frame for frame in self.frames.all()]
-        frame_list_calculated = []
-
-        def _get_next_frame(frame_list, index):
-            try:
-                next_frame = frame_list[index]
-            except IndexError:
-                next_frame = None
-            return next_frame
-
-        for index, frame in enumerate(frame_list):
-            # normal score per frame
-            score = frame.get_frame_score()
-
-            next_frame = _get_next_frame(frame_list, index+1)
-            # check for extra points because of spare
-            if frame.is_spare and next_frame:
-                score += next_frame.get_score_one()
-            
-            # check for extra points because of strike
-            elif frame.is_strike and next_frame:
-                score += next_frame.get_frame_score_for_strike()
-
-                next_next_frame = _get_next_frame(frame_list, index+2)
-                if next_frame.is_strike and next_next_frame:
-                    score += next_next_frame.get_score_one()
-
-            frame_list_calculated.append(score)
-            frame_list[index].score = sum(frame_list_calculated)
-            
-        return sum(frame_list_calculated), frame_list
+        frame_list = self.get_frames()
+        card = self.score_card()
+        for frame, total in zip(frame_list, card.totals):
+            frame.score = total
+        return card.total, frame_list
+
+
+# ids can be handed out again (sqlite after a rollback), a new game must
+# not be answered with the cached result of an earlier one, so whatever
+# inserts games drops the cached results of their ids
+def drop_cached_results(games):
+    for game in games:
+        result_cache.delete(game.id)
+
+
+# a finished game moved out of Game and Frame by the archive_games
+# command, under the id it had, so the hot tables only hold the games
+# that are played or were finished recently
+# its frames are cut from the packed rolls and carry the stored running
+# totals, the rolls are not scored again
+class ArchivedGame(models.Model):
+    id = models.IntegerField(primary_key=True)
+    final_score = models.IntegerField()
+    rolls = models.CharField(max_length=21)
+    # the running total of every frame, comma separated
+    frame_scores = models.CharField(max_length=39)
+    version = models.IntegerField()
+    create_date = models.DateTimeField()
+    finish_date = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['final_score', 'finish_date']),
+            models.Index(fields=['create_date', 'id']),
+        ]
+
+    @classmethod
+    def from_game(cls, game):
+        card = game.score_card()
+        return cls(id=game.id,
+                   final_score=game.final_score,
+                   rolls=game.rolls,
+                   frame_scores=','.join('%d' % total for total in card.totals),
+                   version=game.version,
+                   create_date=game.create_date,
+                   finish_date=game.finish_date)
+
+    # the game as it was before it was archived, not to be saved
+    # its frames and the export are read from the stored score card
+    def as_game(self):
+        game = Game(id=self.id, is_over=True, score=self.final_score,
+                    max_possible=self.final_score, version=self.version,
+                    rolls=self.rolls, is_packed=True,
+                    final_score=self.final_score, finish_date=self.finish_date,
+                    create_date=self.create_date, update_date=self.finish_date)
+        game.score_card = self.score_card
+        return game
+
+    def score_card(self):
+        return ScoreCard.finished(split_frames(unpack_rolls(self.rolls)),
+                                  self.get_frame_scores())
+
+    def get_frame_scores(self):
+        return [int(total) for total in self.frame_scores.split(',')]
+
+
+# the games of several bowlers on one lane, the bowlers take turns frame
+# by frame in the order of their games' positions
+# whose turn it is follows from the rolls of the games, there is nothing
+# else to keep in step with them
+class Match(models.Model):
+    create_date = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def create(cls, bowlers):
+        with transaction.atomic():
+            match = cls.objects.create()
+            for position, bowler in enumerate(bowlers):
+                Game.create(match=match, bowler=bowler, position=position)
+        return match
+
+    # the games in bowler order with their score cards, one query
+    def score_cards(self):
+        return [(game, game.score_card())
+                for game in self.games.order_by('position')]
+
+    # roll for the bowler whose turn it is, return the game
+    # a concurrent roll on the match may change whose turn it is, so the
+    # turn is decided again before every retry
+    def add_score(self, score):
+        for _ in xrange(MAX_WRITE_RETRIES):
+            turn = current_turn(self.score_cards())
+            if turn is None:
+                raise GameOverException()
+            if turn[0]._try_add_score(score):
+                return turn[0]
+        raise ConcurrentUpdateException()
+
+    # the match as returned by /api/match/, the games are scored from
+    # their packed rolls, frames are not read
+    # rank 1 is the best total so far, equal totals share their rank
+    def standings(self):
+        cards = self.score_cards()
+        turn = current_turn(cards)
+        totals = sorted((card.total for _, card in cards), reverse=True)
+        return {
+            'match_id': self.id,
+            'is_over': turn is None,
+            'turn': None if turn is None else {
+                'game_id': turn[0].id,
+                'bowler': turn[0].bowler,
+                'frame': turn[1].frame + 1},
+            'bowlers': [{
+                'position': game.position,
+                'bowler': game.bowler,
+                'game_id': game.id,
+                'is_over': card.is_over,
+                'score': card.total,
+                'max_possible': card.max_possible,
+                'frame_scores': card.totals,
+                'rank': totals.index(card.total) + 1,
+            } for game, card in cards],
+        }
+
+
+# the (game, score card) out of a list of them whose bowler is up: the
+# first one in bowler order among the running games in the earliest
+# frame, None once all games are over
+def current_turn(cards):
+    running = [(card.frame, game.position, game, card)
+               for game, card in cards if not card.is_over]
+    return min(running)[2:] if running else None
+
+
+# the rows of a queryset ordered by (create_date, id) descending that
+# come after before, a (create_date, id) pair
+def _before(queryset, before):
+    if before is None:
+        return queryset
+    create_date, game_id = before
+    return queryset.filter(Q(create_date__lt=create_date) |
+                           Q(create_date=create_date, id__lt=game_id))
+
+
+# the counters of all rolls made on a day, see api.statistics
+# every write adds to them, so /api/statistics/ reads a few rows
+# instead of all frames
+class DailyStatistics(models.Model):
+    day = models.DateField(unique=True)
+    rolls = models.BigIntegerField(default=0)
+    first_balls = models.BigIntegerField(default=0)
+    first_ball_pins = models.BigIntegerField(default=0)
+    strikes = models.BigIntegerField(default=0)
+    spare_chances = models.BigIntegerField(default=0)
+    spares = models.BigIntegerField(default=0)
+    games_finished = models.BigIntegerField(default=0)
+    final_score_total = models.BigIntegerField(default=0)
+
+    counters = COUNTERS + ('games_finished', 'final_score_total')
+
+    # the counters summed over the days in [since, until)
+    @classmethod
+    def totals(cls, since=None, until=None):
+        days = cls.objects.all()
+        if since is not None:
+            days = days.filter(day__gte=since)
+        if until is not None:
+            days = days.filter(day__lt=until)
+        totals = days.aggregate(*[models.Sum(name) for name in cls.counters])
+        return dict((name, totals[name + '__sum'] or 0) for name in cls.counters)
+
+
+# the number of finished games per final score
+class ScoreDistribution(models.Model):
+    score = models.IntegerField(unique=True)
+    games = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ('score', )
+
+    def as_dict(self):
+        return {
+            'score': self.score,
+            'games': self.games
+        }
 
 
+# add the counters and the final scores of the games finished to the
+# statistics of today, or of the given day
+# removed_scores are final scores a correction took back, counts may be
+# negative for the same reason
+def record_statistics(counts, final_scores, removed_scores=(), day=None):
+    counts = dict(counts, games_finished=len(final_scores) - len(removed_scores),
+                  final_score_total=sum(final_scores) - sum(removed_scores))
+    counts = dict((name, value) for name, value in counts.items() if value)
+    if counts:
+        _increment(DailyStatistics, {'day': day or timezone.localdate()}, counts)
+    record_score_distribution(final_scores, removed_scores)
+
+
+# add the final scores to the score distribution, removed_scores are
+# final scores a correction took back
+def record_score_distribution(final_scores, removed_scores=()):
+    distribution = Counter(final_scores)
+    distribution.subtract(removed_scores)
+    for score, games in distribution.items():
+        if games:
+            _increment(ScoreDistribution, {'score': score}, {'games': games})
+
+
+# record_statistics once the write that made the rolls is committed
+# the counters are updated in a short transaction of its own instead of
+# holding the rows of today and of the final scores locked until the
+# write commits, so writes to different games do not queue on them
+# the counters of a write are lost if the process dies right after its
+# commit
+def record_statistics_on_commit(counts, final_scores, removed_scores=()):
+    def record():
+        with transaction.atomic():
+            record_statistics(counts, final_scores, removed_scores)
+    transaction.on_commit(record)
+
+
+# add to the counters of the row found by lookup, the row is created
+# the first time
+def _increment(model, lookup, counts):
+    fields = dict((name, F(name) + value) for name, value in counts.items())
+    if model.objects.filter(**lookup).update(**fields):
+        return
+
+    try:
+        with transaction.atomic():
+            model.objects.create(**dict(lookup, **counts))
+    except IntegrityError:
+        # created by somebody else in between
+        model.objects.filter(**lookup).update(**fields)
+
+
+def parse_game_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# add a list of (game_id, score) rolls, possibly across several games
+# all rolls are checked in memory first and written in one transaction,
+# invalid rolls are skipped and the following rolls are still added
+# return a list of (position, exception) for the skipped rolls
+def add_scores(rolls):
+    for _ in xrange(MAX_WRITE_RETRIES):
+        try:
+            return _add_scores(rolls)
+        except ConcurrentUpdateException:
+            pass
+    raise ConcurrentUpdateException()
+
+
+# the exception for rolls on a game that is not in Game, archived games
+# are over
+def missing_game_exception(game_id):
+    game_id = parse_game_id(game_id)
+    if game_id is not None and ArchivedGame.objects.filter(pk=game_id).exists():
+        return GameOverException()
+    return Game.DoesNotExist()
+
+
+def _add_scores(rolls):
+    game_ids = [parse_game_id(game_id) for game_id, _ in rolls]
+    games = Game.objects.in_bulk(set(game_ids) - set([None]))
+    missing = set(game_ids) - set(games) - set([None])
+    archived = set(ArchivedGame.objects.filter(
+        pk__in=missing).values_list('pk', flat=True)) if missing else set()
+
+    # game id -> [card, first changed frame, frames stored before,
+    #             counters before]
+    played = {}
+    errors = []
+    for position, (game_id, (_, score)) in enumerate(zip(game_ids, rolls)):
+        if game_id not in games:
+            errors.append((position, GameOverException() if game_id in archived
+                           else Game.DoesNotExist()))
+            continue
+
+        if game_id not in played:
+            card = games[game_id].score_card()
+            played[game_id] = [card, None, len(card.frames), card_counts(card)]
+        card, first_changed = played[game_id][:2]
+
+        try:
+            card.roll(score)
+        except (InvalidScoreException, GameOverException) as e:
+            errors.append((position, e))
+            continue
+
+        if first_changed is None or card.first_changed < first_changed:
+            played[game_id][1] = card.first_changed
+
+    played = dict((game_id, value) for game_id, value in played.items()
+                  if value[1] is not None)
+
+    with transaction.atomic():
+        created = []
+        counts = Counter()
+        final_scores = []
+        for game_id, (card, first_changed, stored_frames,
+                      counts_before) in played.items():
+            game = games[game_id]
+            # rolls back the whole batch, add_scores tries again
+            if not game._save_score(card):
+                raise ConcurrentUpdateException()
+
+            new_frames, changed = game._changed_frames(
+                card, first_changed, stored_frames)
+            created.extend(new_frames)
+            game._update_frames(changed)
+
+            counts.update(counts_since(card, counts_before))
+            if card.is_over:
+                final_scores.append(card.total)
+        Frame.objects.bulk_create(created)
+        record_statistics_on_commit(counts, final_scores)
+
+        for game_id in played:
+            games[game_id]._refresh_result()
+
+    return errors
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class TooManySubscribersException(Exception):
+    message = "Too many subscribers, please try again later"
+
+
+# the subscription of one stream to the results of one game
+# only the latest result is kept, a slow reader skips the ones in between
+class Subscription(object):
+
+    def __init__(self, broker, game_id):
+        self.broker = broker
+        self.game_id = game_id
+        self._condition = threading.Condition()
+        self._data = None
+
+    def push(self, data):
+        with self._condition:
+            self._data = data
+            self._condition.notify()
+
+    # the latest result published since the last call, None if there was
+    # none within timeout seconds
+    def get(self, timeout):
+        with self._condition:
+            if self._data is None:
+                self._condition.wait(timeout)
+            data, self._data = self._data, None
+        return data
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+# in-process publish/subscribe of game results, only streams served by
+# the same process are notified
+# another broker (BOWLING_BROKER) needs the same subscribe, unsubscribe
+# and publish methods
+class LocalBroker(object):
+
+    def __init__(self, max_subscribers):
+        self.max_subscribers = max_subscribers
+        self._lock = threading.Lock()
+        self._subscriptions = {}
+        self._count = 0
+
+    def subscribe(self, game_id):
+        subscription = Subscription(self, game_id)
+        with self._lock:
+            if self._count >= self.max_subscribers:
+                raise TooManySubscribersException()
+            self._subscriptions.setdefault(game_id, set()).add(subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.game_id, set())
+            if subscription not in subscriptions:
+                return
+            subscriptions.remove(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.game_id]
+            self._count -= 1
+
+    def publish(self, game_id, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(game_id, ()))
+        for subscription in subscriptions:
+            subscription.push(data)
+
+
+_brokers = {}
+_lock = threading.Lock()
+
+
+# the broker of the process, see BOWLING_BROKER
+def broker():
+    path = getattr(settings, 'BOWLING_BROKER', 'api.pubsub.LocalBroker')
+    max_subscribers = getattr(settings, 'BOWLING_STREAM_MAX_SUBSCRIBERS', 100)
+    with _lock:
+        key = (path, max_subscribers)
+        if key not in _brokers:
+            _brokers[key] = import_string(path)(max_subscribers=max_subscribers)
+        return _brokers[key]
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+
+class GameOverException(Exception):
+    message = "The Game is already finished"
+
+
+class InvalidScoreException(Exception):
+    message = "Invalid score."
+
+
+MAX_SCORE = 10
+MIN_SCORE = 0
+
+FRAME_COUNT = 10
+LAST_FRAME = FRAME_COUNT - 1
+
+
+# a game has at most 21 rolls of 0 to 10 pins, packed as one hex digit
+# (4 bits) per roll they fit in a short string column on the game
+def pack_rolls(rolls):
+    return ''.join('%x' % score for score in rolls)
+
+
+def unpack_rolls(packed):
+    return [int(score, 16) for score in packed]
+
+
+# the rolls of a game cut into its frames, a strike ends every frame but
+# the last one, which keeps its bonus balls
+def split_frames(rolls):
+    frames = []
+    position = 0
+    while position < len(rolls):
+        if len(frames) == LAST_FRAME:
+            frames.append(rolls[position:])
+            break
+        size = 1 if rolls[position] == MAX_SCORE else 2
+        frames.append(rolls[position:position + size])
+        position += size
+    return frames
+
+
+# the rolls allowed next only depend on the frame, the ball within the
+# frame, the pins standing and, in the last frame, whether a third ball
+# was already earned by a strike; these are the states of a finite state
+# machine that is built once, so a roll is checked by one table lookup
+# STATES[state] is (frame, ball, pins, bonus), TRANSITIONS[state][score]
+# the state after the roll or None if the roll is not allowed
+START = 0
+
+
+def _next_state(frame, ball, pins, bonus, score):
+    if frame == FRAME_COUNT or score > pins:
+        return None
+
+    left = pins - score
+    if frame < LAST_FRAME:
+        if ball == 0 and left:
+            return (frame, 1, left, False)
+        return (frame + 1, 0, MAX_SCORE, False)
+
+    # the last frame gets a third ball after a strike or a spare,
+    # the bonus balls are checked on their own against a full rack
+    if ball == 0:
+        return (frame, 1, left or MAX_SCORE, not left)
+    if ball == 1 and (bonus or not left):
+        return (frame, 2, MAX_SCORE, True)
+    return (FRAME_COUNT, 0, 0, False)
+
+
+def _build_machine():
+    states = [(0, 0, MAX_SCORE, False)]
+    numbers = {states[START]: START}
+    transitions = []
+    for state in states:
+        row = []
+        for score in xrange(MAX_SCORE + 1):
+            target = _next_state(*(state + (score, )))
+            if target is not None and target not in numbers:
+                numbers[target] = len(states)
+                states.append(target)
+            row.append(numbers.get(target))
+        transitions.append(tuple(row))
+    return tuple(states), tuple(transitions), numbers[(FRAME_COUNT, 0, 0, False)]
+
+
+STATES, TRANSITIONS, OVER = _build_machine()
+
+
+# the state after a roll, scores are ints, True and False are no scores
+def next_state(state, score):
+    if state == OVER:
+        raise GameOverException()
+    if (isinstance(score, bool) or not isinstance(score, (int, long)) or
+            score < MIN_SCORE or score > MAX_SCORE):
+        raise InvalidScoreException()
+
+    state = TRANSITIONS[state][score]
+    if state is None:
+        raise InvalidScoreException()
+    return state
+
+
+# check a whole roll sequence, from the start of a game or from the given
+# state, without scoring it
+# return the state after the last roll, raise GameOverException or
+# InvalidScoreException at the first roll that is not allowed
+def validate_rolls(rolls, state=START):
+    for score in rolls:
+        state = next_state(state, score)
+    return state
+
+
+# keeps the score of one game, roll by roll, without touching the database
+# every roll only touches the current frame and the (at most two) frames
+# still waiting for a strike or spare bonus
+class ScoreCard(object):
+    __slots__ = ('frames', 'totals', 'settled', 'pending', 'state',
+                 'first_changed')
+
+    def __init__(self):
+        # the rolls of each frame
+        self.frames = []
+        # the running total up to and including each frame
+        self.totals = []
+        # whether a frame's score will not change anymore
+        self.settled = []
+        # [frame index, bonus balls still missing] of strikes and spares
+        self.pending = []
+        # the state of the rolls, see STATES
+        self.state = START
+        # the first frame whose total was changed by the last roll
+        self.first_changed = None
+
+    @classmethod
+    def from_rolls(cls, rolls):
+        card = cls()
+        for score in rolls:
+            card.roll(score)
+        return card
+
+    # the card of a finished game from its rolls cut into frames, see
+    # split_frames, and the running totals kept with them, nothing is
+    # scored again
+    @classmethod
+    def finished(cls, frames, totals):
+        card = cls()
+        card.frames = frames
+        card.totals = totals
+        card.settled = [True] * len(frames)
+        card.state = OVER
+        return card
+
+    # pins standing for the next ball
+    @property
+    def pins(self):
+        return STATES[self.state][2]
+
+    # the index of the frame the next ball goes into, FRAME_COUNT once
+    # the game is over
+    @property
+    def frame(self):
+        return STATES[self.state][0]
+
+    @property
+    def frame_open(self):
+        return STATES[self.state][1] > 0
+
+    @property
+    def is_over(self):
+        return self.state == OVER
+
+    @property
+    def total(self):
+        return self.totals[-1] if self.totals else 0
+
+    # the highest total the game can still reach, every ball left knocks
+    # down all pins standing: the next ball self.pins, all others ten
+    # pending frames get their missing bonus balls, an open frame becomes
+    # a spare and frames not started become strikes worth 30 each
+    # the lowest total still possible is self.total, all balls left missing
+    @property
+    def max_possible(self):
+        if self.is_over:
+            return self.total
+
+        score = self.total + (FRAME_COUNT - len(self.frames)) * 3 * MAX_SCORE
+        for _, missing in self.pending:
+            score += self.pins + (missing - 1) * MAX_SCORE
+        if self.frame_open:
+            # the spare ball and its bonus ball, or the balls left in the
+            # last frame
+            if len(self.frames) == FRAME_COUNT:
+                balls = 3 - len(self.frames[-1])
+            else:
+                balls = 2
+            score += self.pins + (balls - 1) * MAX_SCORE
+        return score
+
+    def rolls(self):
+        return [score for frame in self.frames for score in frame]
+
+    def is_strike(self, index):
+        return self.frames[index][0] == MAX_SCORE
+
+    def is_spare(self, index):
+        rolls = self.frames[index]
+        return (not self.is_strike(index) and len(rolls) > 1 and
+                rolls[0] + rolls[1] == MAX_SCORE)
+
+    def roll(self, score):
+        state = next_state(self.state, score)
+
+        if not self.frame_open:
+            self.frames.append([])
+            self.totals.append(self.total)
+            self.settled.append(False)
+        index = len(self.frames) - 1
+        self.frames[index].append(score)
+
+        self.first_changed = self.pending[0][0] if self.pending else index
+        self._add(index, score)
+        for bonus in self.pending:
+            self._add(bonus[0], score)
+            bonus[1] -= 1
+            if not bonus[1]:
+                self.settled[bonus[0]] = True
+        self.pending = [bonus for bonus in self.pending if bonus[1]]
+
+        self.state = state
+        if not self.frame_open:
+            self._close_frame(index)
+
+    # add the score to a frame and to the running totals behind it
+    def _add(self, index, score):
+        for i in xrange(index, len(self.totals)):
+            self.totals[i] += score
+
+    # strikes wait for two bonus balls, spares for one, the last frame
+    # has its bonus balls in it
+    def _close_frame(self, index):
+        if index == LAST_FRAME:
+            self.settled[index] = True
+        elif self.is_strike(index):
+            self.pending.append([index, 2])
+        elif self.is_spare(index):
+            self.pending.append([index, 1])
+        else:
+            self.settled[index] = True
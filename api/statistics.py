@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import Counter
+
+from api.scoring import MAX_SCORE
+
+
+# the counters kept per day in DailyStatistics, besides the finished games
+COUNTERS = ('rolls', 'first_balls', 'first_ball_pins', 'strikes',
+            'spare_chances', 'spares')
+
+
+# the counters of one frame
+# a spare chance is a second ball after a first ball that was no strike
+def frame_counts(rolls):
+    counts = Counter(rolls=len(rolls))
+    if rolls:
+        counts['first_balls'] += 1
+        counts['first_ball_pins'] += rolls[0]
+        counts['strikes'] += rolls[0] == MAX_SCORE
+    if len(rolls) > 1 and rolls[0] < MAX_SCORE:
+        counts['spare_chances'] += 1
+        counts['spares'] += rolls[0] + rolls[1] == MAX_SCORE
+    return counts
+
+
+# the counters of all frames of a score card
+def card_counts(card):
+    counts = Counter()
+    for rolls in card.frames:
+        counts.update(frame_counts(rolls))
+    return counts
+
+
+# the counters a card gained by its last rolls, counts_before is the
+# card_counts of the card before them
+def counts_since(card, counts_before):
+    counts = card_counts(card)
+    counts.subtract(counts_before)
+    return Counter(dict((name, value) for name, value in counts.items()
+                        if value))
+
+
+# the rates and averages shown by /api/statistics/, None while nothing
+# was counted
+def rates(totals):
+    def ratio(part, whole):
+        return float(totals[part]) / totals[whole] if totals[whole] else None
+
+    return {
+        'strike_rate': ratio('strikes', 'first_balls'),
+        'spare_rate': ratio('spares', 'spare_chances'),
+        'first_ball_average': ratio('first_ball_pins', 'first_balls'),
+        'average_score': ratio('final_score_total', 'games_finished'),
+    }
@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import connection
+from django.test import TransactionTestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import cache
+from api import models
+
+
+# every write runs in a transaction, sqlite starts it with a BEGIN query,
+# the other databases turn autocommit off without one
+TRANSACTION = 1 if connection.vendor == 'sqlite' else 0
+
+# reading the game
+GAME = 1
+# the compare-and-swap update of the game row
+SAVE_GAME = 1
+# adding the rolls to the statistics of today, and the final score
+# to the score distribution once a game is over, in a transaction of
+# their own once the write is committed
+STATISTICS = TRANSACTION + 1
+FINISHED = 1
+# looking in the archive for a game that is not in Game
+ARCHIVE = 1
+# once a write is committed its result is cached and published, which
+# reads the frames of a game that stores them
+PUBLISH = 1
+
+# every accepted write, before the frames
+WRITE = GAME + TRANSACTION + SAVE_GAME + STATISTICS
+
+
+# query budgets of the API endpoints, a change that needs more queries
+# on one of the hot paths has to raise the budget here on purpose
+# the writes are committed as they are outside of tests, so the
+# on_commit callbacks run and their queries are counted
+class QueryBudgetTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.game = models.Game.objects.create(is_packed=False)
+        self.packed_game = models.Game.objects.create(is_packed=True)
+        # the statistics rows are only created by the first write of a day
+        models.DailyStatistics.objects.create(day=timezone.localdate())
+
+    def _add(self, game, score, queries):
+        with self.assertNumQueries(queries):
+            response = self.client.post('/api/add/',
+                                        {'game_id': game.id, 'score': score},
+                                        format='json')
+        return response
+
+    def _play(self, game, scores):
+        for score in scores:
+            game.add_score(score)
+
+    def _correct(self, game, position, score, queries):
+        with self.assertNumQueries(queries):
+            self.client.post('/api/correct/', {'game_id': game.id,
+                                               'position': position,
+                                               'score': score},
+                             format='json')
+
+    # the insert runs in a transaction of its own
+    def test_new_game(self):
+        with self.assertNumQueries(TRANSACTION + 1):
+            self.client.post('/api/new/', format='json')
+
+    def test_first_roll(self):
+        self._add(self.game, 3, WRITE + 1 + PUBLISH)
+
+    def test_second_ball(self):
+        self._play(self.game, [3])
+        self._add(self.game, 4, WRITE + 1 + PUBLISH)
+
+    def test_strike(self):
+        self._add(self.game, 10, WRITE + 1 + PUBLISH)
+
+    # the new frame and the strike before it
+    def test_roll_after_strike(self):
+        self._play(self.game, [10])
+        self._add(self.game, 10, WRITE + 2 + PUBLISH)
+
+    # the new frame and the two strikes before it
+    def test_roll_after_two_strikes(self):
+        self._play(self.game, [10, 10])
+        self._add(self.game, 4, WRITE + 3 + PUBLISH)
+
+    def test_tenth_frame_bonus_ball(self):
+        self._play(self.game, [10] * 11)
+        models.ScoreDistribution.objects.create(score=300)
+        self._add(self.game, 10, WRITE + FINISHED + 1 + PUBLISH)
+        self.assertTrue(models.Game.objects.get(pk=self.game.id).is_over)
+
+    def test_packed_roll(self):
+        self._play(self.packed_game, [10, 10])
+        self._add(self.packed_game, 4, WRITE)
+
+    def test_rejected_rolls(self):
+        self._play(self.game, [6])
+        self._add(self.game, 5, GAME)
+        self._add(self.game, 11, GAME)
+
+        self._play(self.packed_game, [0] * 20)
+        self._add(self.packed_game, 0, GAME)
+
+        with self.assertNumQueries(GAME + ARCHIVE):
+            self.client.post('/api/add/', {'game_id': 99, 'score': 1},
+                             format='json')
+
+    # only the frames from the corrected roll on and the strike before it
+    # still waiting for its bonus are written, frames a removed roll left
+    # over are deleted with one query
+    def test_correct(self):
+        self._play(self.game, [10, 3, 4, 2])
+        self._correct(self.game, 3, 5, WRITE + 1 + PUBLISH)
+        self._correct(self.game, 1, 5, WRITE + 3 + PUBLISH)
+        with self.assertNumQueries(WRITE + 1 + PUBLISH):
+            self.client.post('/api/undo/', {'game_id': self.game.id},
+                             format='json')
+
+        self._play(self.packed_game, [10, 3, 4, 2])
+        self._correct(self.packed_game, 1, 5, WRITE)
+
+    # the strike frame is updated and the new frames are written in one
+    # bulk insert
+    def test_add_many(self):
+        self._play(self.game, [10])
+        with self.assertNumQueries(WRITE + 2 + PUBLISH):
+            self.client.post('/api/add_many/',
+                             {'game_id': self.game.id, 'scores': [3, 4, 10]},
+                             format='json')
+
+    def test_full_game_result(self):
+        self._play(self.game, [10] * 12)
+        self._play(self.packed_game, [10] * 12)
+        cache.results.cache.clear()
+
+        with self.assertNumQueries(GAME + 1):
+            self.client.post('/api/result/', {'game_id': self.game.id},
+                             format='json')
+        with self.assertNumQueries(0):
+            self.client.post('/api/result/', {'game_id': self.game.id},
+                             format='json')
+        with self.assertNumQueries(GAME):
+            self.client.post('/api/result/', {'game_id': self.packed_game.id},
+                             format='json')
+
+    def test_results(self):
+        games = [models.Game.objects.create() for _ in xrange(10)]
+        for game in games:
+            self._play(game, [10] * 12)
+        cache.results.cache.clear()
+
+        with self.assertNumQueries(GAME + 1):
+            self.client.post('/api/results/',
+                             {'game_ids': [game.id for game in games]},
+                             format='json')
+
+    # the best games and the best archived games
+    def test_leaderboard(self):
+        self._play(self.game, [10] * 12)
+        with self.assertNumQueries(1 + ARCHIVE):
+            self.client.post('/api/leaderboard/', format='json')
+
+    # a page of games and one of archived games, whichever page it is,
+    # running games are never archived
+    def test_games(self):
+        games = [models.Game.objects.create() for _ in xrange(5)]
+        cursor = '%s,%d' % (games[2].create_date.isoformat(), games[2].id)
+        with self.assertNumQueries(1 + ARCHIVE):
+            self.client.post('/api/games/', {'limit': 2, 'cursor': cursor},
+                             format='json')
+        with self.assertNumQueries(1):
+            self.client.post('/api/games/', {'status': 'running'},
+                             format='json')
+
+    # the match and all of its games, scored from their rolls
+    def test_match(self):
+        match = models.Match.create(['Ann', 'Bob', 'Cid'])
+        for game in match.games.all():
+            self._play(game, [10, 3, 4])
+        with self.assertNumQueries(2):
+            self.client.post('/api/match/', {'match_id': match.id},
+                             format='json')
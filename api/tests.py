@@ -1,11 +1,34 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.test import TestCase
+import csv
+import datetime
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+from unittest import skipIf
+
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import (RequestFactory, SimpleTestCase, TestCase,
+                         TransactionTestCase, override_settings)
+from django.utils import timezone
+from django.utils.six import StringIO
 from rest_framework.test import APIClient
 
+from api import batch
+from api import cache
+from api import export
 from api import models
+from api import pubsub
+from api import scoring
+from api import statistics
 from api import views
+from api.management.commands import bench, import_games
 
 
 class CreateGameViewTest(TestCase):
@@ -47,6 +70,65 @@ class GameResultTest(TestCase):
         self.assertEqual(data['is_over'], False)
         self.assertEqual(len(data['frames']), 0)
 
+    # stored with the score, a result is read without scoring the rolls
+    def test_max_possible(self):
+        self.assertEqual(self.game.result()['max_possible'], 300)
+        for score in [10, 3]:
+            self.game.add_score(score)
+        self.assertEqual(models.Game.objects.get(pk=self.game.id).max_possible, 280)
+        data = self.client.post('/api/result/',
+                                {'game_id': self.game.id}, format='json').data
+        self.assertEqual(data['max_possible'], 280)
+        self.assertEqual(data['min_guaranteed'], 16)
+
+        for score in [7] + [0] * 16:
+            self.game.add_score(score)
+        data = self.client.post('/api/result/',
+                                {'game_id': self.game.id}, format='json').data
+        self.assertEqual(data['max_possible'], 30)
+        self.assertEqual(data['min_guaranteed'], 30)
+
+    def _since(self, game, since_version):
+        return self.client.post('/api/result/',
+                                {'game_id': game.id,
+                                 'since_version': since_version},
+                                format='json')
+
+    def test_since_version(self):
+        for score in [10, 3, 4, 5]:
+            self.game.add_score(score)
+
+        data = self._since(self.game, 3).data
+        self.assertEqual(data['version'], 4)
+        self.assertEqual(data['score'], 29)
+        self.assertEqual([frame['frame_number'] for frame in data['frames']], [3])
+
+        data = self._since(self.game, 1).data
+        self.assertEqual([(frame['frame_number'], frame['version'])
+                          for frame in data['frames']],
+                         [(1, 3), (2, 3), (3, 4)])
+
+        response = self._since(self.game, 4)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(len(self._since(self.game, 0).data['frames']), 3)
+        self.assertEqual(len(self._since(self.game, 9).data['frames']), 3)
+
+    def test_since_version_packed(self):
+        game = models.Game.objects.create(is_packed=True)
+        for score in [10, 3, 4, 5]:
+            game.add_score(score)
+        self.assertEqual(len(self._since(game, 3).data['frames']), 3)
+        self.assertEqual(self._since(game, 4).content, b'')
+
+    def test_invalid_since_version(self):
+        self.assertEqual(self._since(self.game, 'x').data['error'],
+                         views.ERROR_INVALID_VERSION)
+        self.assertEqual(self._since(self.game, -1).data['error'],
+                         views.ERROR_INVALID_VERSION)
+        for since_version in [True, False]:
+            self.assertEqual(self._since(self.game, since_version).data['error'],
+                             views.ERROR_INVALID_VERSION)
+
     def test_first_legs_game(self):
         self.game.add_score(5)
         self.game.add_score(5)
@@ -199,6 +281,14 @@ class AddScoreTest(TestCase):
         self.assertEqual(response.data.get('error'),
                          models.InvalidScoreException.message)
 
+        # booleans are no scores
+        response = self.client.post('/api/add/',
+                                    {'game_id': self.game.id, 'score': True},
+                                    format='json')
+        self.assertEqual(response.data.get('error'),
+                         models.InvalidScoreException.message)
+        self.assertEqual(self.game.frames.count(), 0)
+
         response = self.client.post('/api/add/',
                                     {'game_id': self.game.id, 'score': 5},
                                     format='json')
@@ -235,6 +325,1409 @@ class AddScoreTest(TestCase):
         self.assertEqual(response.status_code, 405)
 
 
+class CorrectScoreTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.results.cache.clear()
+
+    def _play(self, scores, is_packed=False):
+        game = models.Game.objects.create(is_packed=is_packed)
+        for score in scores:
+            game.add_score(score)
+        return game
+
+    def _post(self, url, **arguments):
+        return self.client.post(url, arguments, format='json')
+
+    # the result of the game against the one of a game played with its
+    # rolls from the start
+    def _assert_replayed(self, game, rolls):
+        def without_ids(result):
+            result = dict(result, frames=[dict(frame) for frame in result['frames']])
+            for frame in result['frames']:
+                del frame['frame_id'], frame['version']
+            del result['game_id'], result['version']
+            return result
+
+        result = self._post('/api/result/', game_id=game.id).data
+        self.assertEqual(models.Game.objects.get(pk=game.id).rolls,
+                         scoring.pack_rolls(rolls))
+        for is_packed in [False, True]:
+            self.assertEqual(without_ids(result),
+                             without_ids(self._play(rolls, is_packed).result()))
+
+    def test_correct(self):
+        for is_packed in [False, True]:
+            game = self._play([10, 3, 4, 2], is_packed)
+            self._post('/api/result/', game_id=game.id)
+            self.assertEqual(self._post('/api/correct/', game_id=game.id,
+                                        position=1, score=5).data, None)
+            self._assert_replayed(game, [10, 5, 4, 2])
+
+            # a strike that was none moves the later rolls to other frames
+            self._post('/api/correct/', game_id=game.id, position=0, score=5)
+            self._assert_replayed(game, [5, 5, 4, 2])
+
+    def test_undo(self):
+        game = self._play([10, 3, 4, 2])
+        self._post('/api/undo/', game_id=game.id)
+        self._assert_replayed(game, [10, 3, 4])
+        self.assertEqual(game.frames.count(), 2)
+
+        self._post('/api/undo/', game_id=game.id, position=0)
+        self._assert_replayed(game, [3, 4])
+        self.assertEqual(game.frames.count(), 1)
+
+    # frames before the position are only written if they wait for a bonus
+    def test_frames_from_the_position(self):
+        game = self._play([3, 4, 10, 3, 4])
+        frames = dict((frame.frame_number, frame.version)
+                      for frame in game.frames.all())
+        game = models.Game.objects.get(pk=game.id)
+        game.correct_score(4, 5)
+
+        versions = [frame.version for frame in game.frames.all()]
+        self.assertEqual(versions, [frames[1], game.version, game.version])
+        data = self._post('/api/result/', game_id=game.id,
+                          since_version=game.version - 1).data
+        self.assertEqual([frame['frame_number'] for frame in data['frames']], [2, 3])
+        self.assertEqual(data['frame_count'], 3)
+
+        # the strike lost its second bonus ball
+        game.undo_score()
+        game.undo_score()
+        data = self._post('/api/result/', game_id=game.id,
+                          since_version=game.version - 1).data
+        self.assertEqual([frame['frame_number'] for frame in data['frames']], [2])
+        self.assertEqual(data['frame_count'], 2)
+
+    def test_invalid_corrections(self):
+        game = self._play([5, 4, 10, 3])
+        for position, score in [(0, 7), (1, 11), (1, -1), (1, 'x')]:
+            response = self._post('/api/correct/', game_id=game.id,
+                                  position=position, score=score)
+            self.assertEqual(response.data['error'],
+                             models.InvalidScoreException.message)
+        # a correction without a score does not remove the roll
+        for arguments in [{}, {'score': None}, {'score': True}, {'score': 1.0}]:
+            response = self._post('/api/correct/', game_id=game.id,
+                                  position=1, **arguments)
+            self.assertEqual(response.data['error'],
+                             models.InvalidScoreException.message)
+        for position in [-1, 4, None, '1', False, True]:
+            response = self._post('/api/correct/', game_id=game.id,
+                                  position=position, score=1)
+            self.assertEqual(response.data['error'],
+                             models.InvalidRollPositionException.message)
+        self._assert_replayed(game, [5, 4, 10, 3])
+
+        response = self._post('/api/undo/', game_id=self._play([]).id)
+        self.assertEqual(response.data['error'],
+                         models.InvalidRollPositionException.message)
+
+        # the game would be over before the last roll
+        game = self._play([0] * 18 + [3, 7, 5])
+        response = self._post('/api/correct/', game_id=game.id,
+                              position=19, score=6)
+        self.assertEqual(response.data['error'],
+                         models.InvalidScoreException.message)
+
+    def test_finished_game(self):
+        game = self._play([3, 4] * 10)
+        finish_date = game.finish_date
+        # a strike would leave a roll over
+        response = self._post('/api/correct/', game_id=game.id, position=0, score=10)
+        self.assertEqual(response.data['error'], models.InvalidScoreException.message)
+        self._post('/api/correct/', game_id=game.id, position=1, score=7)
+
+        game = models.Game.objects.get(pk=game.id)
+        self.assertEqual((game.final_score, game.finish_date), (76, finish_date))
+        self.assertEqual(self._post('/api/leaderboard/').data['games'][0]['score'], 76)
+
+        self._post('/api/undo/', game_id=game.id)
+        game = models.Game.objects.get(pk=game.id)
+        self.assertEqual((game.is_over, game.final_score, game.finish_date),
+                         (False, None, None))
+        self.assertEqual(self._post('/api/leaderboard/').data['games'], [])
+
+    def test_missing_and_archived_games(self):
+        response = self._post('/api/undo/', game_id=99)
+        self.assertEqual(response.data['error'], views.ERROR_GAME_DOES_NOT_EXIST)
+
+        game = self._play([0] * 20)
+        models.Game.objects.filter(pk=game.id).update(
+            finish_date=timezone.now() - datetime.timedelta(days=40))
+        models.Game.objects.create()
+        call_command('archive_games', stdout=StringIO())
+        response = self._post('/api/correct/', game_id=game.id, position=0, score=1)
+        self.assertEqual(response.data['error'], models.GameOverException.message)
+
+    def test_match_turn(self):
+        match = models.Match.create(['Ann', 'Bob'])
+        ann = match.add_score(10)
+        match.add_score(3)
+        self.assertEqual(match.standings()['turn']['bowler'], 'Bob')
+        ann.undo_score()
+        self.assertEqual(match.standings()['turn']['bowler'], 'Ann')
+
+
+class AddManyScoresTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.game = models.Game.objects.create()
+        self.other_game = models.Game.objects.create()
+
+    def test_add_scores(self):
+        response = self.client.post('/api/add_many/',
+                                    {'game_id': self.game.id,
+                                     'scores': [10, 10, 4, 2, 5]},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'errors': []})
+
+        game = models.Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.score, 51)
+        self.assertEqual([f.score for f in game.frames.all()],
+                         [24, 40, 46, 51])
+        self.assertEqual(game.frames.last().score_one, 5)
+
+    def test_add_scores_across_games(self):
+        response = self.client.post('/api/add_many/',
+                                    {'rolls': [
+                                        {'game_id': self.game.id, 'score': 3},
+                                        {'game_id': self.other_game.id, 'score': 10},
+                                        {'game_id': self.game.id, 'score': 7},
+                                        {'game_id': self.game.id, 'score': 2},
+                                    ]},
+                                    format='json')
+        self.assertEqual(response.data, {'errors': []})
+        self.assertEqual(models.Game.objects.get(pk=self.game.id).score, 14)
+        self.assertEqual(models.Game.objects.get(pk=self.other_game.id).score, 10)
+
+    def test_add_scores_errors(self):
+        response = self.client.post('/api/add_many/',
+                                    {'rolls': [
+                                        {'game_id': self.game.id, 'score': 6},
+                                        {'game_id': self.game.id, 'score': 5},
+                                        {'game_id': 99, 'score': 1},
+                                        {'game_id': self.game.id, 'score': 4},
+                                        'hihi',
+                                    ]},
+                                    format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'error': models.InvalidScoreException.message},
+            {'index': 2, 'error': views.ERROR_GAME_DOES_NOT_EXIST},
+            {'index': 4, 'error': views.ERROR_GAME_DOES_NOT_EXIST},
+        ])
+        self.assertEqual(self.game.frames.get().get_rolls(), [6, 4])
+
+    def test_add_scores_game_over(self):
+        response = self.client.post('/api/add_many/',
+                                    {'game_id': self.game.id,
+                                     'scores': [10] * 13},
+                                    format='json')
+        self.assertEqual(response.data['errors'], [
+            {'index': 12, 'error': models.GameOverException.message},
+        ])
+        self.assertTrue(models.Game.objects.get(pk=self.game.id).is_over)
+
+    def test_invalid_request(self):
+        response = self.client.post('/api/add_many/',
+                                    {'game_id': self.game.id, 'scores': 5},
+                                    format='json')
+        self.assertEqual(response.data.get('error'), views.ERROR_INVALID_ROLLS)
+
+        response = self.client.post('/api/add_many/',
+                                    {'game_id': self.game.id,
+                                     'scores': [0] * (views.MAX_ROLLS_PER_REQUEST + 1)},
+                                    format='json')
+        self.assertEqual(response.data.get('error'), views.ERROR_TOO_MANY_ROLLS)
+        self.assertEqual(self.game.frames.count(), 0)
+
+
+# the lean views answer every request like the DRF views
+class LeanViewsTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.game = models.Game.objects.create(is_packed=True)
+
+    def _compare(self, drf_view, lean_view, body,
+                 content_type='application/json', method='post'):
+        responses = []
+        for view in (drf_view, lean_view):
+            request = getattr(self.factory, method)(
+                '/api/', body, content_type=content_type)
+            response = view(request)
+            if hasattr(response, 'render'):
+                response.render()
+            responses.append((response.status_code,
+                              response.get('Content-Type'), response.content))
+        self.assertEqual(responses[0], responses[1])
+        return responses[1]
+
+    def _add(self, data, **kwargs):
+        # the lean view adds the score as well, undo the DRF one first
+        game = models.Game.objects.get(pk=self.game.id)
+        rolls = game.rolls
+
+        def drf_view(request):
+            response = views.AddScoreView.as_view()(request)
+            models.Game.objects.filter(pk=self.game.id).update(rolls=rolls)
+            return response
+        return self._compare(drf_view, views.add_score, data, **kwargs)
+
+    def _result(self, data, **kwargs):
+        return self._compare(views.GameResultView.as_view(), views.game_result,
+                             data, **kwargs)
+
+    def test_add(self):
+        self.assertEqual(
+            self._add(json.dumps({'game_id': self.game.id, 'score': 10})),
+            (200, None, b''))
+        self.assertEqual(models.Game.objects.get(pk=self.game.id).score, 10)
+
+        self._add(json.dumps({'game_id': self.game.id, 'score': 11}))
+        self._add(json.dumps({'game_id': 99, 'score': 1}))
+        self._add(json.dumps({'score': 1}))
+        self._add('')
+        self._add('{"game_id": ')
+        self._add('game_id=%d&score=3' % self.game.id,
+                  content_type='application/x-www-form-urlencoded')
+        self.assertEqual(
+            self._add('game_id=%d&score=3' % self.game.id,
+                      content_type='text/plain; charset=utf-8')[0], 415)
+        self._add('', content_type='text/plain')
+        self._add('', method='get')
+        self.assertEqual(self._add('', method='options')[0], 200)
+
+    def test_game_over(self):
+        for score in [0] * 20:
+            self.game.add_score(score)
+        content = self._add(json.dumps({'game_id': self.game.id, 'score': 1}))[2]
+        self.assertEqual(json.loads(content.decode('utf-8')),
+                         {'error': models.GameOverException.message})
+
+    def test_result(self):
+        for score in [10, 3, 4]:
+            self.game.add_score(score)
+        cache.results.delete(self.game.id)
+
+        content = self._result(json.dumps({'game_id': self.game.id}))[2]
+        self.assertEqual(json.loads(content.decode('utf-8')), self.game.result())
+        self._result(json.dumps({'game_id': self.game.id}))
+        self._result(json.dumps({'game_id': 99}))
+        self._result(json.dumps({'game_id': self.game.id, 'since_version': 2}))
+        self._result(json.dumps({'game_id': self.game.id, 'since_version': 3}))
+        self._result(json.dumps({'game_id': 'x'}))
+        self._result('{')
+        self._result('', method='get')
+        self._result('', method='options')
+
+
+class PackedGameTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.game = models.Game.objects.create(is_packed=True)
+        self.frames_game = models.Game.objects.create(is_packed=False)
+
+    def _result(self, game):
+        return self.client.post('/api/result/',
+                                {'game_id': game.id}, format='json').data
+
+    def test_no_frame_rows(self):
+        for score in [5, 5, 10, 0, 3]:
+            self.game.add_score(score)
+        self.assertEqual(self.game.frames.count(), 0)
+
+        game = models.Game.objects.get(pk=self.game.id)
+        self.assertEqual(game.rolls, '55a03')
+        self.assertEqual(game.score, 36)
+
+    def test_same_result_as_frames(self):
+        for score in [10] * 9 + [3, 7, 5]:
+            self.game.add_score(score)
+            self.frames_game.add_score(score)
+
+        packed = self._result(self.game)
+        stored = self._result(self.frames_game)
+        # frames of packed games all carry the current version
+        for frame in packed['frames'] + stored['frames']:
+            frame.pop('frame_id')
+            frame.pop('version')
+        stored['game_id'] = packed['game_id']
+        self.assertEqual(packed, stored)
+        self.assertEqual(packed['score'], 268)
+
+    def test_add_scores(self):
+        errors = models.add_scores([(self.game.id, 6), (self.game.id, 5),
+                                    (self.game.id, 4)])
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(models.Game.objects.get(pk=self.game.id).rolls, '64')
+
+    def test_calculate_score(self):
+        for score in [2, 8, 2, 8, 6, 2]:
+            self.game.add_score(score)
+        score, frames = self.game.calculate_score()
+        self.assertEqual(score, 36)
+        self.assertEqual([frame.score for frame in frames], [12, 28, 36])
+
+
+class GameResultsTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.games = [models.Game.objects.create() for _ in xrange(3)]
+        for index, game in enumerate(self.games):
+            for score in [10, 3, index]:
+                game.add_score(score)
+        cache.results.cache.clear()
+
+    def _results(self, game_ids):
+        return self.client.post('/api/results/',
+                                {'game_ids': game_ids}, format='json')
+
+    def test_same_as_single_result(self):
+        game_ids = [game.id for game in reversed(self.games)]
+        results = self._results(game_ids).data['results']
+
+        self.assertEqual([result['game_id'] for result in results], game_ids)
+        for game_id, result in zip(game_ids, results):
+            single = self.client.post('/api/result/',
+                                      {'game_id': game_id}, format='json')
+            self.assertEqual(result, single.data)
+
+    def test_one_query_for_games_and_one_for_frames(self):
+        with self.assertNumQueries(2):
+            self._results([game.id for game in self.games])
+        with self.assertNumQueries(0):
+            self._results([game.id for game in self.games])
+
+    def test_missing_game(self):
+        results = self._results([self.games[0].id, 99, 'x', None]).data['results']
+        self.assertEqual(results[0]['score'], 16)
+        self.assertEqual([result['game_id'] for result in results[1:]],
+                         [99, 'x', None])
+        for result in results[1:]:
+            self.assertEqual(result['error'], views.ERROR_GAME_DOES_NOT_EXIST)
+
+    def test_invalid_request(self):
+        response = self._results(self.games[0].id)
+        self.assertEqual(response.data['error'], views.ERROR_INVALID_GAME_IDS)
+
+        response = self._results([1] * (views.MAX_GAMES_PER_REQUEST + 1))
+        self.assertEqual(response.data['error'], views.ERROR_TOO_MANY_GAMES)
+
+
+class LeaderboardTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.perfect = self._play([10] * 12)
+        self.lame = self._play([10] * 9 + [3, 4])
+        self.horrible = self._play([0] * 20)
+        self.running = self._play([10] * 11)
+
+    def _play(self, scores):
+        game = models.Game.objects.create()
+        for score in scores:
+            game.add_score(score)
+        return game
+
+    def _leaderboard(self, **arguments):
+        return self.client.post('/api/leaderboard/', arguments, format='json')
+
+    def test_final_score(self):
+        self.assertEqual(self.perfect.final_score, 300)
+        self.assertTrue(self.perfect.finish_date is not None)
+        self.assertEqual(self.running.final_score, None)
+        self.assertEqual(self.running.finish_date, None)
+
+    def test_best_games_first(self):
+        games = self._leaderboard().data['games']
+        self.assertEqual([(game['game_id'], game['score']) for game in games],
+                         [(self.perfect.id, 300), (self.lame.id, 257),
+                          (self.horrible.id, 0)])
+
+        games = self._leaderboard(limit=1).data['games']
+        self.assertEqual([game['game_id'] for game in games], [self.perfect.id])
+
+    def test_date_window(self):
+        models.Game.objects.filter(pk=self.perfect.id).update(
+            finish_date=timezone.now() - datetime.timedelta(days=2))
+        today = timezone.localtime(timezone.now()).date().isoformat()
+
+        games = self._leaderboard(since=today).data['games']
+        self.assertEqual([game['game_id'] for game in games],
+                         [self.lame.id, self.horrible.id])
+
+        games = self._leaderboard(until=today).data['games']
+        self.assertEqual([game['game_id'] for game in games], [self.perfect.id])
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self._leaderboard(limit=0).data['error'],
+                         views.ERROR_INVALID_LIMIT)
+        self.assertEqual(self._leaderboard(limit=views.MAX_LEADERBOARD_SIZE + 1).data['error'],
+                         views.ERROR_INVALID_LIMIT)
+        self.assertEqual(self._leaderboard(since='yesterday').data['error'],
+                         views.ERROR_INVALID_DATE)
+
+
+class GamesTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.games = [models.Game.objects.create() for _ in xrange(5)]
+        for score in [10] * 12:
+            self.games[1].add_score(score)
+        self.games[3].add_score(7)
+        # two games created at the same time, the id decides
+        models.Game.objects.filter(pk=self.games[4].id).update(
+            create_date=models.Game.objects.get(pk=self.games[3].id).create_date)
+
+    def _games(self, **arguments):
+        return self.client.post('/api/games/', arguments, format='json').data
+
+    def _all_pages(self, **arguments):
+        game_ids, cursor = [], None
+        while True:
+            data = self._games(cursor=cursor, **arguments)
+            game_ids.extend(game['game_id'] for game in data['games'])
+            cursor = data['next_cursor']
+            if cursor is None:
+                return game_ids
+
+    def test_newest_first(self):
+        data = self._games()
+        self.assertEqual([game['game_id'] for game in data['games']],
+                         [game.id for game in reversed(self.games)])
+        self.assertEqual(data['next_cursor'], None)
+
+        summary = data['games'][1]
+        self.assertEqual((summary['score'], summary['is_over'],
+                          summary['version']), (7, False, 1))
+
+    def test_pages(self):
+        game_ids = [game.id for game in reversed(self.games)]
+        for limit in xrange(1, 6):
+            self.assertEqual(self._all_pages(limit=limit), game_ids)
+
+        data = self._games(limit=2)
+        self.assertEqual(data['next_cursor'],
+                         views.game_cursor(models.Game.objects.get(pk=game_ids[1])))
+
+    def test_status(self):
+        self.assertEqual(self._all_pages(status='over', limit=1), [self.games[1].id])
+        self.assertEqual(self._all_pages(status='running', limit=2),
+                         [game.id for game in reversed(self.games)
+                          if game.id != self.games[1].id])
+
+    def test_archived_games(self):
+        models.Game.objects.filter(pk=self.games[1].id).update(
+            finish_date=timezone.now() - datetime.timedelta(days=40))
+        call_command('archive_games', stdout=StringIO())
+
+        self.assertEqual(self._all_pages(limit=2),
+                         [game.id for game in reversed(self.games)])
+        self.assertEqual(self._all_pages(status='over'), [self.games[1].id])
+        self.assertNotIn(self.games[1].id, self._all_pages(status='running'))
+
+    def test_invalid_arguments(self):
+        self.assertEqual(self._games(limit=0)['error'], views.ERROR_INVALID_LIMIT)
+        self.assertEqual(self._games(limit=views.MAX_GAMES_PAGE_SIZE + 1)['error'],
+                         views.ERROR_INVALID_LIMIT)
+        self.assertEqual(self._games(status='lost')['error'],
+                         views.ERROR_INVALID_STATUS)
+        for cursor in ['12', 'yesterday,12', '2018-01-01T10:00:00,x', 12]:
+            self.assertEqual(self._games(cursor=cursor)['error'],
+                             views.ERROR_INVALID_CURSOR)
+
+
+class MatchTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        data = self._post('/api/match/new/', bowlers=['Ann', 'Bob', 'Cid'])
+        self.match_id, self.game_ids = data['match_id'], data['game_ids']
+
+    def _post(self, url, **arguments):
+        return self.client.post(url, arguments, format='json').data
+
+    def _roll(self, score):
+        return self._post('/api/match/add/', match_id=self.match_id,
+                          score=score)
+
+    def _standings(self):
+        return self._post('/api/match/', match_id=self.match_id)
+
+    def test_new_match(self):
+        games = models.Game.objects.filter(match=self.match_id).order_by('position')
+        self.assertEqual([(game.id, game.bowler, game.position) for game in games],
+                         list(zip(self.game_ids, ['Ann', 'Bob', 'Cid'], [0, 1, 2])))
+
+        standings = self._standings()
+        self.assertEqual(standings['turn'], {'game_id': self.game_ids[0],
+                                             'bowler': 'Ann', 'frame': 1})
+        self.assertFalse(standings['is_over'])
+        self.assertEqual([bowler['rank'] for bowler in standings['bowlers']],
+                         [1, 1, 1])
+
+    # a frame each, in bowler order, whether it is a strike or two balls
+    def test_turns(self):
+        self.assertEqual(self._roll(10), {'game_id': self.game_ids[0]})
+        self.assertEqual(self._roll(3), {'game_id': self.game_ids[1]})
+        self.assertEqual(self._roll(4), {'game_id': self.game_ids[1]})
+        self.assertEqual(self._roll(9), {'game_id': self.game_ids[2]})
+        self.assertEqual(self._standings()['turn']['game_id'], self.game_ids[2])
+        self.assertEqual(self._roll(1), {'game_id': self.game_ids[2]})
+
+        turn = self._standings()['turn']
+        self.assertEqual((turn['game_id'], turn['frame']), (self.game_ids[0], 2))
+
+    # the turn follows the games, however their rolls were added
+    def test_turn_from_games(self):
+        models.Game.objects.get(pk=self.game_ids[0]).add_score(10)
+        self.assertEqual(self._roll(2), {'game_id': self.game_ids[1]})
+
+    # the bowler in the last frame rolls the bonus balls before the next one
+    def test_standings(self):
+        for _ in xrange(9):
+            for score in [10, 3, 7, 0, 0]:
+                self._roll(score)
+        for score, position in [(10, 0), (10, 0), (10, 0), (3, 1), (7, 1),
+                                (10, 1), (0, 2)]:
+            self.assertEqual(self._roll(score),
+                             {'game_id': self.game_ids[position]})
+        self.assertEqual(self._roll(0), {'game_id': self.game_ids[2]})
+
+        standings = self._standings()
+        self.assertTrue(standings['is_over'])
+        self.assertEqual(standings['turn'], None)
+        self.assertEqual([(bowler['bowler'], bowler['score'], bowler['rank'])
+                          for bowler in standings['bowlers']],
+                         [('Ann', 300, 1), ('Bob', 137, 2), ('Cid', 0, 3)])
+        for bowler in standings['bowlers']:
+            result = self._post('/api/result/', game_id=bowler['game_id'])
+            self.assertEqual(bowler['frame_scores'],
+                             [frame['score'] for frame in result['frames']])
+
+        self.assertEqual(self._roll(1)['error'], models.GameOverException.message)
+
+    def test_max_possible(self):
+        self._roll(10)
+        bowlers = self._standings()['bowlers']
+        self.assertEqual([bowler['max_possible'] for bowler in bowlers],
+                         [300, 300, 300])
+        self._roll(0)
+        self.assertEqual(self._standings()['bowlers'][1]['max_possible'], 290)
+
+    def test_errors(self):
+        self.assertEqual(self._roll(11)['error'], models.InvalidScoreException.message)
+        self.assertEqual(self._post('/api/match/', match_id=99)['error'],
+                         views.ERROR_MATCH_DOES_NOT_EXIST)
+        self.assertEqual(self._post('/api/match/add/', match_id='x', score=1)['error'],
+                         views.ERROR_MATCH_DOES_NOT_EXIST)
+        for bowlers in [None, [], ['Ann', 3], ['Ann', ''], 'Ann']:
+            self.assertEqual(self._post('/api/match/new/', bowlers=bowlers)['error'],
+                             views.ERROR_INVALID_BOWLERS)
+        self.assertEqual(self._post('/api/match/new/', bowlers=['Ann'] * 7)['error'],
+                         views.ERROR_TOO_MANY_BOWLERS)
+
+    def test_not_archived(self):
+        self._roll(10)
+        models.Game.objects.filter(pk=self.game_ids[0]).update(
+            is_over=True, finish_date=timezone.now() - datetime.timedelta(days=40))
+        models.Game.objects.create()
+        call_command('archive_games', stdout=StringIO())
+        self.assertFalse(models.ArchivedGame.objects.exists())
+
+
+# the statistics are recorded once a write is committed
+class StatisticsTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.perfect = models.Game.objects.create()
+        for score in [10] * 12:
+            self.perfect.add_score(score)
+        self.spares = models.Game.objects.create(is_packed=True)
+        self.client.post('/api/add_many/',
+                         {'game_id': self.spares.id,
+                          'scores': [9, 1] * 10 + [10, 4]},
+                         format='json')
+        self.running = models.Game.objects.create()
+        for score in [3, 4, 5]:
+            self.running.add_score(score)
+        self.assertRaises(models.InvalidScoreException,
+                          self.running.add_score, 6)
+
+    def _statistics(self, **arguments):
+        return self.client.post('/api/statistics/', arguments, format='json')
+
+    def test_frame_counts(self):
+        self.assertEqual(statistics.frame_counts([10, 10, 3]),
+                         {'rolls': 3, 'first_balls': 1, 'first_ball_pins': 10,
+                          'strikes': 1})
+        self.assertEqual(statistics.frame_counts([3, 7]),
+                         {'rolls': 2, 'first_balls': 1, 'first_ball_pins': 3,
+                          'strikes': 0, 'spare_chances': 1, 'spares': 1})
+
+    # the counters kept roll by roll match counting all games again
+    def test_counters(self):
+        totals = models.DailyStatistics.totals()
+        self.assertEqual(totals['games_finished'], 2)
+        self.assertEqual(totals['final_score_total'], 491)
+        for name in statistics.COUNTERS:
+            self.assertEqual(totals[name], sum(
+                statistics.card_counts(game.score_card())[name]
+                for game in models.Game.objects.all()))
+
+    def test_statistics(self):
+        data = self._statistics().data
+        self.assertEqual(data['rolls'], 36)
+        self.assertEqual(data['games_finished'], 2)
+        self.assertAlmostEqual(data['strike_rate'], 10 / 22.0)
+        self.assertAlmostEqual(data['spare_rate'], 10 / 11.0)
+        self.assertAlmostEqual(data['first_ball_average'], 9.0)
+        self.assertAlmostEqual(data['average_score'], 245.5)
+        self.assertEqual(data['score_distribution'],
+                         [{'score': 191, 'games': 1}, {'score': 300, 'games': 1}])
+
+    def test_day_window(self):
+        today = timezone.localdate()
+        models.DailyStatistics.objects.update(
+            day=today - datetime.timedelta(days=2))
+
+        data = self._statistics(since=today.isoformat()).data
+        self.assertEqual(data['rolls'], 0)
+        self.assertEqual(data['strike_rate'], None)
+
+        data = self._statistics(until=today.isoformat()).data
+        self.assertEqual(data['rolls'], 36)
+
+    # a correction moves the final score in the distribution, an undo
+    # takes the game out of it again
+    def test_correction(self):
+        game = models.Game.objects.create()
+        for score in [3, 4] * 10:
+            game.add_score(score)
+        game.correct_score(1, 7)
+
+        def distribution():
+            return [(score.score, score.games) for score in
+                    models.ScoreDistribution.objects.filter(games__gt=0)]
+        self.assertEqual(distribution(), [(76, 1), (191, 1), (300, 1)])
+        totals = models.DailyStatistics.totals()
+        self.assertEqual((totals['rolls'], totals['spares'],
+                          totals['games_finished'], totals['final_score_total']),
+                         (56, 11, 3, 567))
+
+        game.undo_score()
+        self.assertEqual(distribution(), [(191, 1), (300, 1)])
+        totals = models.DailyStatistics.totals()
+        self.assertEqual((totals['rolls'], totals['games_finished'],
+                          totals['final_score_total']), (55, 2, 491))
+
+    def test_invalid_date(self):
+        self.assertEqual(self._statistics(since='yesterday').data['error'],
+                         views.ERROR_INVALID_DATE)
+        self.assertEqual(self._statistics(until=12).data['error'],
+                         views.ERROR_INVALID_DATE)
+
+
+class ExportTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.games = [models.Game.objects.create() for _ in xrange(5)]
+        for score in [10, 10, 3]:
+            self.games[1].add_score(score)
+        self.games[2].is_packed = True
+        self.games[2].save()
+        for score in [2, 8, 4]:
+            self.games[2].add_score(score)
+
+    def _export(self, **arguments):
+        response = self.client.post('/api/export/', arguments, format='json')
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_keyset_chunks(self):
+        games = list(export.iter_games(chunk_size=2))
+        self.assertEqual([game.id for game in games],
+                         [game.id for game in self.games])
+
+        # three chunks of games, one of archived games
+        with self.assertNumQueries(4):
+            list(export.iter_games(chunk_size=2))
+
+        games = list(export.iter_games(after=self.games[2].id))
+        self.assertEqual([game.id for game in games],
+                         [game.id for game in self.games[3:]])
+
+    def test_ndjson(self):
+        lines = self._export().splitlines()
+        self.assertEqual(len(lines), 5)
+
+        record = json.loads(lines[1])
+        self.assertEqual(record['game_id'], self.games[1].id)
+        self.assertEqual(record['rolls'], [10, 10, 3])
+        self.assertEqual(record['frame_scores'], [23, 36, 39])
+        self.assertEqual(record['score'], 39)
+
+        record = json.loads(lines[2])
+        self.assertEqual(record['frame_scores'], [14, 18])
+
+    def test_csv(self):
+        rows = list(csv.reader(self._export(format='csv').splitlines()))
+        self.assertEqual(rows[0], list(export.CSV_COLUMNS))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[2][0], str(self.games[1].id))
+        self.assertEqual(rows[2][-3:], ['39', '10 10 3', '23 36 39'])
+
+    def test_invalid_format(self):
+        response = self.client.post('/api/export/', {'format': 'xml'},
+                                    format='json')
+        self.assertEqual(response.data['error'], views.ERROR_INVALID_FORMAT)
+
+    def test_command(self):
+        output = StringIO()
+        call_command('export_games', format='csv', chunk_size=2, stdout=output)
+        self.assertEqual(len(output.getvalue().splitlines()), 6)
+
+
+class ImportGamesTest(TestCase):
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as games:
+            games.write("2018-09-01T16:20:00 10 10 10 10 10 10 10 10 10 10 10 10\n"
+                        "# a comment\n"
+                        "\n"
+                        "3,4,5,5,10,0,0,1,2,3,4,5,4,9,1,10,10,10,3\n"
+                        "1 2 3\n"
+                        "5 6\n"
+                        "1 x\n"
+                        "2018-13-01 10 10 10 10 10 10 10 10 10 10 10 10\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def _import(self, **options):
+        options.setdefault('date', '2018-09-02')
+        out, err = StringIO(), StringIO()
+        call_command('import_games', self.path, workers=2, batch_size=1,
+                     stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_import(self):
+        out, err = self._import()
+        self.assertTrue(out.startswith("imported 2 games (31 rolls), 4 invalid"))
+        self.assertEqual(err.splitlines(), [
+            "line 5: %s" % import_games.ERROR_NOT_FINISHED,
+            "line 6: %s" % models.InvalidScoreException.message,
+            "line 7: %s" % import_games.ERROR_NOT_A_NUMBER,
+            "line 8: %s" % import_games.ERROR_INVALID_DATE,
+        ])
+
+        perfect, other = models.Game.objects.order_by('id')
+        self.assertEqual(perfect.final_score, 300)
+        self.assertEqual(perfect.frames.count(), 10)
+        self.assertEqual(other.result()['score'], 129)
+        self.assertEqual(other.result(), models.Game.objects.get(pk=other.id).result())
+        self.assertEqual(other.frames.last().get_rolls(), [10, 10, 3])
+
+        totals = models.DailyStatistics.totals()
+        self.assertEqual(totals['rolls'], 31)
+        self.assertEqual(totals['final_score_total'], 429)
+
+    # the games are counted on the days they were played, not today
+    def test_dates(self):
+        self._import()
+        perfect, other = models.Game.objects.order_by('id')
+        self.assertEqual(timezone.localtime(perfect.finish_date).isoformat(),
+                         '2018-09-01T16:20:00+00:00')
+        self.assertEqual(timezone.localtime(other.finish_date).isoformat(),
+                         '2018-09-02T00:00:00+00:00')
+
+        self.assertEqual([(day.day.isoformat(), day.rolls, day.final_score_total)
+                          for day in models.DailyStatistics.objects.order_by('day')],
+                         [('2018-09-01', 12, 300), ('2018-09-02', 19, 129)])
+        self.assertEqual(models.Game.leaderboard(10, since=timezone.now() -
+                                                 datetime.timedelta(days=1)), [])
+
+    # games without a date are imported without a finish date, and only
+    # counted in the score distribution
+    def test_no_date(self):
+        out, err = self._import(date=None)
+        self.assertTrue(out.startswith("imported 2 games (31 rolls), 4 invalid"))
+
+        perfect, other = models.Game.objects.order_by('id')
+        self.assertEqual((other.final_score, other.finish_date), (129, None))
+        self.assertEqual([(day.day.isoformat(), day.rolls, day.final_score_total)
+                          for day in models.DailyStatistics.objects.all()],
+                         [('2018-09-01', 12, 300)])
+        self.assertEqual([score.as_dict() for score in models.ScoreDistribution.objects.all()],
+                         [{'score': 129, 'games': 1}, {'score': 300, 'games': 1}])
+        self.assertEqual([game.id for game in models.Game.leaderboard(10)],
+                         [perfect.id, other.id])
+
+        # before a dated game with the same score
+        game = models.Game.objects.create()
+        for score in other.score_card().rolls():
+            game.add_score(score)
+        self.assertEqual([game.id for game in models.Game.leaderboard(10)],
+                         [perfect.id, other.id, game.id])
+
+        with self.assertRaises(CommandError):
+            self._import(date='yesterday')
+
+    def test_import_packed(self):
+        self._import(packed=True)
+        self.assertEqual(models.Game.objects.filter(is_packed=True).count(), 2)
+        self.assertEqual(models.Frame.objects.count(), 0)
+        self.assertEqual(models.Game.objects.order_by('id')[1].result()['score'], 129)
+
+
+class ArchiveGamesTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.old = [self._play([10] * 12), self._play([3, 4] * 10)]
+        self.running = self._play([10] * 3)
+        self.recent = self._play([0] * 20)
+        self.newest = self._play([5] * 21)
+        models.Game.objects.filter(pk__in=[self.old[0].id, self.old[1].id,
+                                           self.newest.id]).update(
+            finish_date=timezone.now() - datetime.timedelta(days=40))
+        self.results = dict((game.id, self._result(game.id))
+                            for game in self.old)
+        cache.results.cache.clear()
+
+    def _play(self, scores):
+        game = models.Game.objects.create()
+        for score in scores:
+            game.add_score(score)
+        return game
+
+    def _result(self, game_id, **arguments):
+        arguments['game_id'] = game_id
+        return self.client.post('/api/result/', arguments, format='json').data
+
+    def _archive(self, **options):
+        output = StringIO()
+        call_command('archive_games', stdout=output, **options)
+        return output.getvalue()
+
+    # frames of archived games have no ids and carry the game's version
+    def _without_frame_ids(self, result):
+        result = dict(result, frames=[dict(frame) for frame in result['frames']])
+        for frame in result['frames']:
+            del frame['frame_id'], frame['version']
+        return result
+
+    # a correction after the game was archived finds it gone
+    def test_correct_archived(self):
+        game = models.Game.objects.get(pk=self.old[1].id)
+        self._archive()
+        self.assertRaises(models.Game.DoesNotExist, game.correct_score, 1, 7)
+        self.assertEqual(models.ArchivedGame.objects.get(pk=game.id).final_score, 70)
+
+    def test_archive(self):
+        self.assertEqual(self._archive(), "archived 2 games\n")
+
+        self.assertEqual(set(models.Game.objects.values_list('id', flat=True)),
+                         set([self.running.id, self.recent.id, self.newest.id]))
+        self.assertFalse(models.Frame.objects.filter(
+            game_id__in=[game.id for game in self.old]).exists())
+
+        archived = models.ArchivedGame.objects.get(pk=self.old[0].id)
+        self.assertEqual(archived.final_score, 300)
+        self.assertEqual(archived.get_frame_scores(),
+                         [30, 60, 90, 120, 150, 180, 210, 240, 270, 300])
+
+    def test_result(self):
+        self._archive()
+        for game in self.old:
+            result = self._result(game.id)
+            self.assertEqual(self._without_frame_ids(result),
+                             self._without_frame_ids(self.results[game.id]))
+
+        version = self.results[self.old[1].id]['version']
+        self.assertEqual(self._result(self.old[1].id, since_version=version), None)
+        result = self._result(self.old[1].id, since_version=version - 1)
+        self.assertEqual(len(result['frames']), 10)
+
+        results = self.client.post('/api/results/', {'game_ids': [
+            self.old[0].id, self.recent.id]}, format='json').data['results']
+        self.assertEqual([result['score'] for result in results], [300, 0])
+
+    # the frames carry the stored totals, the rolls are not scored again
+    def test_stored_frame_scores(self):
+        self._archive()
+        frame_scores = [1, 2, 3, 4, 5, 6, 7, 8, 9, 70]
+        models.ArchivedGame.objects.filter(pk=self.old[1].id).update(
+            frame_scores=','.join('%d' % total for total in frame_scores))
+
+        result = self._result(self.old[1].id)
+        self.assertEqual([frame['score'] for frame in result['frames']], frame_scores)
+        self.assertEqual([frame['score_one'] for frame in result['frames']], [3] * 10)
+        self.assertTrue(all(frame['is_settled'] for frame in result['frames']))
+        records = [export.game_record(game) for game in export.iter_games()]
+        self.assertEqual(records[1]['frame_scores'], frame_scores)
+
+    def test_leaderboard_and_export(self):
+        self._archive()
+        games = self.client.post('/api/leaderboard/', {},
+                                 format='json').data['games']
+        self.assertEqual([game['game_id'] for game in games],
+                         [self.old[0].id, self.newest.id, self.old[1].id,
+                          self.recent.id])
+
+        self.assertEqual([game.id for game in export.iter_games(chunk_size=1)],
+                         [game.id for game in self.old] +
+                         [self.running.id, self.recent.id, self.newest.id])
+
+    def test_archived_games_are_over(self):
+        self._archive()
+        response = self.client.post('/api/add/', {
+            'game_id': self.old[0].id, 'score': 1}, format='json')
+        self.assertEqual(response.data['error'], models.GameOverException.message)
+
+        response = self.client.post('/api/add_many/', {'rolls': [
+            {'game_id': self.old[1].id, 'score': 1},
+            {'game_id': 99, 'score': 1}]}, format='json')
+        self.assertEqual(response.data['errors'], [
+            {'index': 0, 'error': models.GameOverException.message},
+            {'index': 1, 'error': views.ERROR_GAME_DOES_NOT_EXIST}])
+
+    def test_batches(self):
+        self.assertEqual(self._archive(batch_size=1, batches=1),
+                         "archived 1 games\n")
+        self.assertEqual(list(models.ArchivedGame.objects.values_list(
+            'id', flat=True)), [self.old[0].id])
+        self.assertEqual(self._archive(days=60), "archived 0 games\n")
+
+
+@skipIf(batch.numpy is None, "numpy is not installed")
+class BatchScoreTest(TestCase):
+
+    # finished and unfinished games, scored through the models and at
+    # once from their roll matrix
+    def test_same_scores_as_games(self):
+        rng = random.Random(15)
+        games = [[], [10] * 12, [0] * 20, [5] * 21, [9, 1] * 10 + [10],
+                 [10] * 9 + [3, 7, 2], [10] * 10 + [7, 7], [10] * 9 + [1, 2],
+                 [10, 10], [10, 3], [3, 7], [3]]
+        for _ in xrange(50):
+            rolls = bench.random_game(rng)
+            games.append(rolls)
+            games.append(rolls[:rng.randint(1, len(rolls) - 1)])
+
+        played = [models.Game.objects.create(is_packed=False) for _ in games]
+        errors = models.add_scores([(game.id, score)
+                                    for game, rolls in zip(played, games)
+                                    for score in rolls])
+        self.assertEqual(errors, [])
+
+        scores, totals = batch.score_games(batch.roll_matrix(games))
+        for row, game in enumerate(played):
+            game.refresh_from_db()
+            score, frames = game.calculate_score()
+            self.assertEqual(scores[row], score)
+            self.assertEqual(
+                list(totals[row]),
+                [frame.score for frame in frames] +
+                [batch.PADDING] * (scoring.FRAME_COUNT - len(frames)))
+
+    def test_roll_matrix(self):
+        matrix = batch.roll_matrix([[10] * 12, [3, 4]])
+        self.assertEqual(matrix.shape, (2, batch.MAX_ROLLS))
+        self.assertEqual(list(matrix[1, :3]), [3, 4, batch.PADDING])
+
+    def test_invalid_shape(self):
+        self.assertRaises(ValueError, batch.score_games, [[10] * 12])
+
+
+class BenchTest(SimpleTestCase):
+
+    def test_percentile(self):
+        timings = [5, 1, 4, 2, 3]
+        self.assertEqual(bench.percentile(timings, 0.5), 3)
+        self.assertEqual(bench.percentile(timings, 0.99), 5)
+
+    def test_compare(self):
+        baseline = {'create': {'ops_per_sec': 100.0, 'queries_per_op': 2.0},
+                    'gone': {'ops_per_sec': 100.0, 'queries_per_op': 2.0}}
+        command = bench.Command()
+
+        results = {'create': {'ops_per_sec': 85.0, 'queries_per_op': 2.0}}
+        self.assertEqual(command._compare(results, baseline, 0.2), [])
+
+        results = {'create': {'ops_per_sec': 75.0, 'queries_per_op': 3.0}}
+        self.assertEqual(len(command._compare(results, baseline, 0.2)), 2)
+
+
+class _Records(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+@override_settings(MIDDLEWARE=settings.MIDDLEWARE +
+                   ['api.middleware.TimingMiddleware'])
+class TimingMiddlewareTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.game = models.Game.objects.create()
+        self.records = _Records()
+        self.logger = logging.getLogger('api.timing')
+        self.handlers = self.logger.handlers
+        self.logger.handlers = [self.records]
+
+    def tearDown(self):
+        self.logger.handlers = self.handlers
+
+    def test_server_timing(self):
+        response = self.client.post('/api/add/',
+                                    {'game_id': self.game.id, 'score': 5},
+                                    format='json')
+        names = [metric.split(';')[0]
+                 for metric in response['Server-Timing'].split(', ')]
+        self.assertEqual(names, ['db', 'view', 'serialize', 'total'])
+
+        record = self.records.records[-1]
+        self.assertEqual(record.path, '/api/add/')
+        self.assertEqual(record.status, 200)
+        self.assertTrue(record.queries > 0)
+        self.assertTrue('desc="%d queries"' % record.queries
+                        in response['Server-Timing'])
+        self.assertTrue(record.total >= record.view)
+
+    @override_settings(BOWLING_TIMING_SAMPLE_RATE=0)
+    def test_not_sampled(self):
+        response = self.client.post('/api/result/',
+                                    {'game_id': self.game.id}, format='json')
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(self.records.records, [])
+        self.assertFalse(connection.force_debug_cursor)
+
+
+class LRUCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = cache.LRUCache('test', {'OPTIONS': {'MAX_ENTRIES': 2}})
+        self.cache.clear()
+
+    def test_least_recently_used_is_dropped(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.set('c', 3)
+
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertEqual(self.cache.get('b'), None)
+        self.assertEqual(self.cache.get('c'), 3)
+
+    def test_timeout(self):
+        self.cache.set('a', 1, timeout=0)
+        self.assertEqual(self.cache.get('a'), None)
+        self.assertTrue(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 2)
+
+    def test_add_keeps_existing_entry(self):
+        self.assertTrue(self.cache.add('a', 1))
+        self.assertFalse(self.cache.add('a', 2))
+        self.assertEqual(self.cache.get('a'), 1)
+        self.cache.delete('a')
+        self.assertFalse(self.cache.has_key('a'))
+
+
+class ResultCacheTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.game = models.Game.create()
+
+    def _result(self):
+        return self.client.post('/api/result/',
+                                {'game_id': self.game.id}, format='json').data
+
+    def test_hits_and_misses(self):
+        stats = cache.results.stats()
+        self._result()
+        self._result()
+        self._result()
+        self.assertEqual(cache.results.stats(),
+                         {'hits': stats['hits'] + 2,
+                          'misses': stats['misses'] + 1})
+
+        response = self.client.post('/api/cache/', format='json')
+        self.assertEqual(response.data, cache.results.stats())
+
+    # sqlite hands the id of a rolled back game out again
+    def test_new_game_drops_stale_result(self):
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.game = models.Game.create()
+                self.game.add_score(7)
+                self.assertEqual(self._result()['score'], 7)
+                raise IntegrityError()
+
+        self.game = models.Game.create()
+        self.assertEqual(self._result()['score'], 0)
+
+    def test_add_score_invalidates(self):
+        self.assertEqual(self._result()['score'], 0)
+        self.game.add_score(7)
+        self.assertEqual(self._result()['score'], 7)
+        models.add_scores([(self.game.id, 2)])
+        self.assertEqual(self._result()['frames'][0]['score_two'], 2)
+
+
+class ResultCacheCommitTest(TransactionTestCase):
+
+    def test_refreshed_after_commit(self):
+        game = models.Game.objects.create()
+        game.add_score(10)
+        game.add_score(3)
+        self.assertEqual(cache.results.get(game.id), game.result())
+        self.assertEqual(cache.results.get(game.id)['score'], 16)
+
+    def test_published_after_commit(self):
+        game = models.Game.objects.create()
+        subscription = pubsub.broker().subscribe(game.id)
+        try:
+            game.add_score(10)
+            self.assertEqual(subscription.get(0)['score'], 10)
+            models.add_scores([(game.id, 3), (game.id, 4)])
+            self.assertEqual(subscription.get(0)['score'], 24)
+        finally:
+            subscription.close()
+
+
+class LocalBrokerTest(SimpleTestCase):
+    def setUp(self):
+        self.broker = pubsub.LocalBroker(max_subscribers=2)
+
+    def test_publish(self):
+        subscription = self.broker.subscribe(1)
+        other = self.broker.subscribe(2)
+        self.broker.publish(1, {'score': 3})
+        self.broker.publish(1, {'score': 7})
+        self.assertEqual(subscription.get(0), {'score': 7})
+        self.assertEqual(subscription.get(0), None)
+        self.assertEqual(other.get(0), None)
+
+    def test_wakes_up_reader(self):
+        subscription = self.broker.subscribe(1)
+        timer = threading.Timer(0.05, self.broker.publish, (1, {'score': 3}))
+        timer.start()
+        self.assertEqual(subscription.get(5), {'score': 3})
+        timer.join()
+
+    def test_max_subscribers(self):
+        subscription = self.broker.subscribe(1)
+        self.broker.subscribe(1)
+        self.assertRaises(pubsub.TooManySubscribersException,
+                          self.broker.subscribe, 2)
+
+        subscription.close()
+        subscription.close()
+        self.broker.subscribe(2)
+
+
+# the stream closes the database connection, which a test transaction
+# does not survive
+@override_settings(BOWLING_STREAM_TIMEOUT=0.1, BOWLING_STREAM_KEEPALIVE=0.05)
+class StreamTest(TransactionTestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.game = models.Game.objects.create()
+
+    def _stream(self, game_id, **headers):
+        return self.client.get('/api/stream/', {'game_id': game_id}, **headers)
+
+    def _event(self, chunk):
+        lines = chunk.decode('utf-8').splitlines()
+        self.assertEqual(lines[1], 'event: result')
+        return int(lines[0][len('id: '):]), json.loads(lines[2][len('data: '):])
+
+    def _error(self, response):
+        return json.loads(response.content.decode('utf-8'))['error']
+
+    def _read(self, response):
+        return list(response.streaming_content)
+
+    def test_game_does_not_exist(self):
+        self.assertEqual(self._error(self._stream(99)),
+                         views.ERROR_GAME_DOES_NOT_EXIST)
+        self.assertEqual(self._error(self._stream('x')),
+                         views.ERROR_GAME_DOES_NOT_EXIST)
+
+    def test_updates(self):
+        self.game.add_score(10)
+        response = self._stream(self.game.id)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = iter(response.streaming_content)
+        self.assertEqual(self._event(next(events)), (1, self.game.result()))
+
+        self.game.add_score(3)
+        version, data = self._event(next(events))
+        self.assertEqual((version, data['score']), (2, 16))
+
+        # keepalives until the stream times out, the test client closes
+        # the stream once it is read to the end
+        self.assertTrue(set(events) <= set([b': keepalive\n\n']))
+
+    # the connection is not held while the stream is open
+    def test_connection_closed(self):
+        self.game.add_score(10)
+        cache.results.cache.clear()
+        response = self._stream(self.game.id)
+        self.assertIsNone(connection.connection)
+        self.assertEqual(self._event(next(iter(response.streaming_content)))[0], 1)
+
+    def test_finished_game(self):
+        for score in [10] * 12:
+            self.game.add_score(score)
+        events = self._read(self._stream(self.game.id))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(self._event(events[0])[1]['score'], 300)
+
+    def test_reconnect(self):
+        self.game.add_score(10)
+        response = self._stream(self.game.id, HTTP_LAST_EVENT_ID='1')
+        self.assertEqual(self._read(response)[0], b': keepalive\n\n')
+
+    @override_settings(BOWLING_STREAM_MAX_SUBSCRIBERS=1)
+    def test_max_subscribers(self):
+        response = self._stream(self.game.id)
+        self.assertEqual(self._error(self._stream(self.game.id)),
+                         pubsub.TooManySubscribersException.message)
+        self._read(response)
+        self.assertTrue(self._read(self._stream(self.game.id)))
+
+    def test_post_not_allowed(self):
+        response = self.client.post('/api/stream/', {'game_id': self.game.id},
+                                    format='json')
+        self.assertEqual(response.status_code, 405)
+
+
+class ConcurrentAddScoreTest(TransactionTestCase):
+
+    def test_stale_game_is_retried(self):
+        game = models.Game.objects.create()
+        stale = models.Game.objects.get(pk=game.pk)
+        game.add_score(3)
+
+        stale.add_score(4)
+        self.assertEqual(stale.version, 2)
+        self.assertEqual(game.frames.get().get_rolls(), [3, 4])
+
+    def test_many_threads_one_game(self):
+        # every thread opens its own connection, an in-memory sqlite test
+        # database is not shared between them
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest("needs a database shared between threads")
+
+        game = models.Game.objects.create()
+        errors = []
+
+        def bowl():
+            try:
+                for _ in xrange(3):
+                    try:
+                        models.Game.objects.get(pk=game.pk).add_score(1)
+                    except models.ConcurrentUpdateException:
+                        pass
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=bowl) for _ in xrange(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        game.refresh_from_db()
+        frames = list(game.frames.all())
+        rolls = [score for frame in frames for score in frame.get_rolls()]
+        self.assertEqual(game.version, len(rolls))
+        self.assertEqual(game.score, sum(rolls))
+        self.assertEqual(len(frames), (len(rolls) + 1) // 2)
+        self.assertEqual([f.is_last_frame for f in frames].count(True),
+                         1 if len(frames) == 10 else 0)
+
+
+# rolls in the states of the roll state machine through add_score
+class AddScoreStatesTest(TestCase):
+    LAST = [0] * 18
+    CASES = [
+        ([], 0, (0, 10)),
+        ([], 3, (0, 7)),
+        ([], 10, (1, 10)),
+        ([], 11, scoring.InvalidScoreException),
+        ([], -1, scoring.InvalidScoreException),
+        ([3], 7, (1, 10)),
+        ([3], 0, (1, 10)),
+        ([3], 8, scoring.InvalidScoreException),
+        ([10], 10, (2, 10)),
+        ([10, 3], 7, (2, 10)),
+        ([10, 3], 8, scoring.InvalidScoreException),
+        (LAST, 10, (9, 10)),
+        (LAST, 4, (9, 6)),
+        (LAST + [10], 10, (9, 10)),
+        # the bonus balls of the last frame are each rolled at a full rack
+        (LAST + [10], 3, (9, 10)),
+        (LAST + [10, 10], 10, (10, 0)),
+        (LAST + [10, 10], 11, scoring.InvalidScoreException),
+        (LAST + [10, 3], 10, (10, 0)),
+        (LAST + [3], 7, (9, 10)),
+        (LAST + [3], 6, (10, 0)),
+        (LAST + [3], 8, scoring.InvalidScoreException),
+        (LAST + [3, 7], 10, (10, 0)),
+        (LAST + [3, 4], 0, scoring.GameOverException),
+        (LAST + [10, 10, 10], 0, scoring.GameOverException),
+        (LAST + [3, 7, 5], 11, scoring.GameOverException),
+    ]
+
+    # against hand-written expectations: the frame the next ball goes
+    # into and the pins standing for it, or the exception
+    def test_states(self):
+        for prefix, score, expected in self.CASES:
+            game = models.Game.objects.create(
+                rolls=scoring.pack_rolls(prefix), is_packed=True)
+            if not isinstance(expected, tuple):
+                with self.assertRaises(expected):
+                    game.add_score(score)
+                continue
+
+            game.add_score(score)
+            card = models.Game.objects.get(pk=game.id).score_card()
+            self.assertEqual(card.rolls(), prefix + [score])
+            self.assertEqual((card.frame, card.pins), expected,
+                             (prefix, score))
+
+    # every roll in every state of the roll state machine, against the
+    # rules before it
+    def test_all_states(self):
+        for prefix in _state_prefixes().values():
+            pins = _reference_pins(prefix)
+            for score in xrange(-1, 12):
+                game = models.Game.objects.create(
+                    rolls=scoring.pack_rolls(prefix), is_packed=True)
+                if pins is None:
+                    self.assertRaises(scoring.GameOverException,
+                                      game.add_score, score)
+                elif not 0 <= score <= pins:
+                    self.assertRaises(scoring.InvalidScoreException,
+                                      game.add_score, score)
+                else:
+                    game.add_score(score)
+                    card = models.Game.objects.get(pk=game.id).score_card()
+                    self.assertEqual(card.rolls(), prefix + [score])
+                    self.assertEqual(card.pins,
+                                     _reference_pins(prefix + [score]) or 0,
+                                     (prefix, score))
+
+
 class ModelTest(TestCase):
     def setUp(self):
         self.game = models.Game.objects.create()
@@ -267,6 +1760,33 @@ class ModelTest(TestCase):
         self.game.add_score(3)
         self.assertEqual(self.game.frames.count(), 4)
 
+    def test_stored_running_totals(self):
+        self.game.add_score(10)
+        self.game.add_score(10)
+        self.assertEqual(self.game.score, 30)
+        self.assertEqual(
+            [(f.score, f.is_settled) for f in self.game.frames.all()],
+            [(20, False), (30, False)])
+
+        self.game.add_score(4)
+        self.game.add_score(2)
+        self.assertEqual(self.game.score, 46)
+        self.assertEqual(
+            [(f.score, f.is_settled) for f in self.game.frames.all()],
+            [(24, True), (40, True), (46, True)])
+        self.assertEqual(models.Game.objects.get(pk=self.game.pk).score, 46)
+
+    def test_frame_numbers(self):
+        self._create_strike_frames(12)
+        self.assertEqual(
+            [frame.frame_number for frame in self.game.frames.all()],
+            range(1, 11))
+        self.assertEqual(self.game.result()['frames'][9]['frame_number'], 10)
+
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                models.Frame.objects.create(game=self.game, frame_number=10)
+
     def test_invalid_score(self):
         self.assertRaises(models.InvalidScoreException,
                           self.game.add_score, 11)
@@ -540,3 +2060,186 @@ class ModelTest(TestCase):
 		self.game.add_score(3)
 		self.assertEqual(self.game.calculate_score()[0], 64)
 
+
+# a roll prefix leading to every state of the roll state machine
+def _state_prefixes():
+    prefixes = {scoring.START: []}
+    queue = [scoring.START]
+    for state in queue:
+        for score, target in enumerate(scoring.TRANSITIONS[state]):
+            if target is not None and target not in prefixes:
+                prefixes[target] = prefixes[state] + [score]
+                queue.append(target)
+    return prefixes
+
+
+# the pins standing after the rolls, None once the game is over,
+# walking the frames like the scoring did before the state machine
+def _reference_pins(rolls):
+    position = 0
+    for frame in xrange(scoring.LAST_FRAME):
+        if position >= len(rolls):
+            return 10
+        if rolls[position] == 10:
+            position += 1
+        elif position + 1 == len(rolls):
+            return 10 - rolls[position]
+        else:
+            position += 2
+
+    last = rolls[position:]
+    if len(last) == 0:
+        return 10
+    if len(last) == 1:
+        return 10 if last[0] == 10 else 10 - last[0]
+    if len(last) == 2 and last[0] + last[1] >= 10:
+        return 10
+    return None
+
+
+class RollStateMachineTest(SimpleTestCase):
+    def test_states(self):
+        prefixes = _state_prefixes()
+        self.assertEqual(len(prefixes), len(scoring.STATES))
+        self.assertEqual(scoring.STATES[scoring.OVER], (scoring.FRAME_COUNT, 0, 0, False))
+        self.assertEqual(scoring.TRANSITIONS[scoring.OVER], (None, ) * 11)
+
+    # every roll in every state against the rules before
+    def test_transitions(self):
+        for state, prefix in _state_prefixes().items():
+            pins = _reference_pins(prefix)
+            self.assertEqual(scoring.STATES[state][2], pins or 0)
+            for score in xrange(-1, 12):
+                if pins is None:
+                    self.assertRaises(scoring.GameOverException,
+                                      scoring.next_state, state, score)
+                elif 0 <= score <= pins:
+                    target = scoring.next_state(state, score)
+                    self.assertEqual(target, scoring.validate_rolls(prefix + [score]))
+                else:
+                    self.assertRaises(scoring.InvalidScoreException,
+                                      scoring.next_state, state, score)
+
+    def test_validate_rolls(self):
+        self.assertEqual(scoring.validate_rolls([10] * 12), scoring.OVER)
+        self.assertEqual(scoring.validate_rolls([10] * 10 + [7, 7]), scoring.OVER)
+        self.assertEqual(scoring.validate_rolls([3], scoring.validate_rolls([4])),
+                         scoring.validate_rolls([4, 3]))
+        self.assertRaises(scoring.InvalidScoreException,
+                          scoring.validate_rolls, [3, 8])
+        self.assertRaises(scoring.InvalidScoreException,
+                          scoring.validate_rolls, [3, 1.5])
+        self.assertRaises(scoring.GameOverException,
+                          scoring.validate_rolls, [0] * 21)
+
+
+class ScoreCardTest(SimpleTestCase):
+
+    # the best final score by trying all rolls left
+    def _best_score(self, rolls):
+        card = scoring.ScoreCard.from_rolls(rolls)
+        if card.is_over:
+            return card.total
+        return max(self._best_score(rolls + [score])
+                   for score in xrange(card.pins + 1))
+
+    # the final score when every ball left knocks down all pins standing
+    def _all_pins_score(self, rolls):
+        card = scoring.ScoreCard.from_rolls(rolls)
+        while not card.is_over:
+            card.roll(card.pins)
+        return card.total
+
+    def test_max_possible(self):
+        self.assertEqual(scoring.ScoreCard().max_possible, 300)
+        self.assertEqual(scoring.ScoreCard.from_rolls([10, 3]).max_possible, 280)
+        self.assertEqual(scoring.ScoreCard.from_rolls([0] * 20).max_possible, 0)
+
+        rng = random.Random(17)
+        games = [[10] * 12, [0] * 20, [5] * 21, [10] * 9 + [3, 7, 5],
+                 [10] * 10 + [7, 7], [3, 4] * 10]
+        games.extend(bench.random_game(rng) for _ in xrange(20))
+        for rolls in games:
+            for count in xrange(len(rolls) + 1):
+                card = scoring.ScoreCard.from_rolls(rolls[:count])
+                self.assertEqual(card.max_possible,
+                                 self._all_pins_score(rolls[:count]))
+
+    def test_max_possible_is_best(self):
+        for rolls in ([10] * 9, [0] * 16 + [4], [5, 5] * 8 + [5], [10] * 9 + [3],
+                      [10] * 10, [10] * 9 + [10, 4], [2, 3] * 9 + [4, 6]):
+            card = scoring.ScoreCard.from_rolls(rolls)
+            self.assertEqual(card.max_possible, self._best_score(rolls))
+
+    def test_empty_card(self):
+        card = scoring.ScoreCard()
+        self.assertEqual(card.total, 0)
+        self.assertEqual(card.totals, [])
+        self.assertFalse(card.is_over)
+
+    def test_running_totals(self):
+        card = scoring.ScoreCard.from_rolls([5, 5, 10, 0, 3])
+        self.assertEqual(card.totals, [20, 33, 36])
+        self.assertEqual(card.settled, [True, True, True])
+        self.assertEqual(card.total, 36)
+
+    def test_pending_bonus(self):
+        card = scoring.ScoreCard.from_rolls([10, 10])
+        self.assertEqual(card.totals, [20, 30])
+        self.assertEqual(card.settled, [False, False])
+
+        card.roll(4)
+        self.assertEqual(card.totals, [24, 38, 42])
+        self.assertEqual(card.settled, [True, False, False])
+
+        card.roll(2)
+        self.assertEqual(card.totals, [24, 40, 46])
+        self.assertEqual(card.settled, [True, True, True])
+
+    def test_perfect_game(self):
+        card = scoring.ScoreCard.from_rolls([10] * 12)
+        self.assertEqual(card.total, 300)
+        self.assertTrue(card.is_over)
+        self.assertEqual(card.frames[-1], [10, 10, 10])
+        self.assertRaises(scoring.GameOverException, card.roll, 0)
+
+    def test_lame_finish(self):
+        card = scoring.ScoreCard.from_rolls([10] * 9 + [3, 4])
+        self.assertEqual(card.total, 257)
+        self.assertTrue(card.is_over)
+
+    def test_spare_finish(self):
+        card = scoring.ScoreCard.from_rolls([10] * 9 + [3, 7, 5])
+        self.assertEqual(card.total, 268)
+        self.assertTrue(card.is_spare(9))
+        self.assertTrue(card.is_over)
+
+    def test_invalid_scores(self):
+        card = scoring.ScoreCard()
+        for score in (11, -1, 0.5, "hihi", None, True, False):
+            self.assertRaises(scoring.InvalidScoreException,
+                              card.roll, score)
+
+        card.roll(6)
+        self.assertRaises(scoring.InvalidScoreException, card.roll, 5)
+        card.roll(4)
+        self.assertEqual(card.rolls(), [6, 4])
+
+    def test_split_frames(self):
+        for rolls in ([], [3], [10, 3], [10] * 12, [3, 4] * 10,
+                      [9, 1] * 10 + [10], [0] * 18 + [10, 10, 3]):
+            self.assertEqual(scoring.split_frames(rolls),
+                             scoring.ScoreCard.from_rolls(rolls).frames)
+
+    def test_pack_rolls(self):
+        rolls = [10] * 9 + [3, 7, 5]
+        packed = scoring.pack_rolls(rolls)
+        self.assertEqual(packed, 'aaaaaaaaa375')
+        self.assertEqual(scoring.unpack_rolls(packed), rolls)
+        self.assertEqual(scoring.unpack_rolls(''), [])
+
+    def test_last_frame_bonus_balls(self):
+        card = scoring.ScoreCard.from_rolls([10] * 10)
+        card.roll(7)
+        card.roll(7)
+        self.assertTrue(card.is_over)
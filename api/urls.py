@@ -1,8 +1,27 @@
+from django.conf import settings
 from django.conf.urls import url
 from api import views
 
+if getattr(settings, 'BOWLING_LEAN_VIEWS', False):
+	add_view, result_view = views.add_score, views.game_result
+else:
+	add_view, result_view = views.AddScoreView.as_view(), views.GameResultView.as_view()
+
 urlpatterns = [
+	url(r'^match/new/$', views.CreateMatchView.as_view(), name='match_new'),
+	url(r'^match/add/$', views.AddMatchScoreView.as_view(), name='match_add'),
+	url(r'^match/$', views.MatchView.as_view(), name='match'),
 	url('new/', views.CreateGameView.as_view(), name='new'),
-	url('add/', views.AddScoreView.as_view(), name='add'),
-	url('result/', views.GameResultView.as_view(), name='result'),
+	url('add/', add_view, name='add'),
+	url('correct/', views.CorrectScoreView.as_view(), name='correct'),
+	url('undo/', views.UndoScoreView.as_view(), name='undo'),
+	url('add_many/', views.AddManyScoresView.as_view(), name='add_many'),
+	url('stream/', views.stream_result, name='stream'),
+	url('games/', views.GamesView.as_view(), name='games'),
+	url('results/', views.GameResultsView.as_view(), name='results'),
+	url('result/', result_view, name='result'),
+	url('leaderboard/', views.LeaderboardView.as_view(), name='leaderboard'),
+	url('statistics/', views.StatisticsView.as_view(), name='statistics'),
+	url('export/', views.ExportView.as_view(), name='export'),
+	url('cache/', views.ResultCacheStatsView.as_view(), name='cache'),
 ]
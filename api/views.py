@@ -1,16 +1,157 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
+import datetime
+import json
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.views.decorators.csrf import csrf_exempt
 
 from rest_framework.views import APIView
 from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from api import export
 from api import models
+from api import pubsub
+from api import statistics
+from api.cache import results as result_cache
 
 
 ERROR_GAME_DOES_NOT_EXIST = "Game does not exist"
+ERROR_INVALID_ROLLS = "Rolls have to be a list"
+ERROR_TOO_MANY_ROLLS = "Too many rolls"
+ERROR_INVALID_GAME_IDS = "Game ids have to be a list"
+ERROR_TOO_MANY_GAMES = "Too many games"
+ERROR_INVALID_LIMIT = "Invalid limit"
+ERROR_INVALID_DATE = "Invalid date"
+ERROR_INVALID_FORMAT = "Invalid format"
+ERROR_INVALID_VERSION = "Invalid version"
+ERROR_INVALID_STATUS = "Invalid status"
+ERROR_INVALID_CURSOR = "Invalid cursor"
+ERROR_MATCH_DOES_NOT_EXIST = "Match does not exist"
+ERROR_INVALID_BOWLERS = "Bowlers have to be a list of names"
+ERROR_TOO_MANY_BOWLERS = "Too many bowlers"
+
+MAX_ROLLS_PER_REQUEST = 1000
+MAX_GAMES_PER_REQUEST = 50
+LEADERBOARD_SIZE = 50
+MAX_LEADERBOARD_SIZE = 100
+GAMES_PAGE_SIZE = 20
+MAX_BOWLERS = 6
+MAX_BOWLER_NAME_LENGTH = 50
+MAX_GAMES_PAGE_SIZE = 100
+
+# the status filter of /api/games/, the is_over value listed
+GAME_STATUSES = {'running': False, 'over': True}
+
+
+# a datetime or a date (meaning its midnight), in the current time zone
+# when no offset is given
+def parse_date_argument(value):
+    if value is None:
+        return None
+    value = parse_datetime(value) or parse_date(value)
+    if value is None:
+        raise ValueError(value)
+    if not hasattr(value, 'hour'):
+        value = datetime.datetime.combine(value, datetime.time())
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+
+def parse_day_argument(value):
+    if value is None:
+        return None
+    day = parse_date(value)
+    if day is None:
+        raise ValueError(value)
+    return day
+
+
+# the position of a game in the listing of /api/games/, create date and
+# id, handed to the client as an opaque string
+def game_cursor(game):
+    return '%s,%d' % (game.create_date.isoformat(), game.id)
+
+
+def parse_game_cursor(value):
+    if value is None:
+        return None
+    create_date, game_id = value.rsplit(',', 1)
+    create_date = parse_datetime(create_date)
+    if create_date is None:
+        raise ValueError(value)
+    return create_date, int(game_id)
+
+
+# the frames of a result payload changed after since_version, None when
+# the client is up to date
+# a client ahead of the game (a game id handed out again) gets it all
+# frame_count tells the client to drop the frames a corrected roll removed
+def result_delta(data, since_version):
+    if since_version == data['version']:
+        return None
+    if since_version > data['version']:
+        return data
+
+    delta = dict(data)
+    delta['frames'] = [frame for frame in data['frames']
+                       if frame['version'] > since_version]
+    delta['frame_count'] = len(data['frames'])
+    return delta
+
+
+# the result payload of a game, from the cache if possible, None if
+# the game does not exist
+def game_result_data(game_id):
+    data = result_cache.get(game_id) if game_id is not None else None
+    if data is not None:
+        return data
+
+    try:
+        game = models.Game.objects.get(pk=game_id)
+    except models.Game.DoesNotExist:
+        try:
+            game = models.ArchivedGame.objects.get(pk=game_id).as_game()
+        except models.ArchivedGame.DoesNotExist:
+            return None
+
+    data = game.result()
+    result_cache.add(game_id, data)
+    return data
+
+
+# the result of a game, with since_version only the frames changed since
+# that version of the game
+def game_result_response(arguments):
+    # true and false are ints in python, but no versions
+    since_version = arguments.get('since_version')
+    if since_version is not None and (
+            isinstance(since_version, bool) or
+            not isinstance(since_version, (int, long)) or since_version < 0):
+        return {'error': ERROR_INVALID_VERSION}
+
+    data = game_result_data(models.parse_game_id(arguments.get('game_id')))
+    if data is None:
+        return {'error': ERROR_GAME_DOES_NOT_EXIST}
+    if since_version is None:
+        return data
+    return result_delta(data, since_version)
+
+
+def error_message(e):
+    if isinstance(e, models.Game.DoesNotExist):
+        return ERROR_GAME_DOES_NOT_EXIST
+    return e.message
 
 
 class GameResultView(APIView):
@@ -18,15 +159,201 @@ class GameResultView(APIView):
     renderer_classes = (JSONRenderer, )
 
     def post(self, request, format=None):
+        return Response(game_result_response(request.data))
+
+
+class GameResultsView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    # the results of several games, in the order of the game ids
+    # cached results are used as they are, all others are read with one
+    # query for the games and one for their frames, and one more for the
+    # archived games among them
+    def post(self, request, format=None):
+        game_ids = request.data.get('game_ids')
+        if not isinstance(game_ids, list):
+            return Response({'error': ERROR_INVALID_GAME_IDS})
+        if len(game_ids) > MAX_GAMES_PER_REQUEST:
+            return Response({'error': ERROR_TOO_MANY_GAMES})
+
+        requested = game_ids
+        game_ids = [models.parse_game_id(game_id) for game_id in game_ids]
+        results = result_cache.get_many(set(game_ids) - set([None]))
+
+        missing = set(game_ids) - set(results) - set([None])
+        if missing:
+            games = list(models.Game.objects.filter(
+                pk__in=missing).prefetch_related('frames'))
+            missing -= set(game.id for game in games)
+            if missing:
+                games.extend(game.as_game() for game in
+                             models.ArchivedGame.objects.filter(pk__in=missing))
+            for game in games:
+                results[game.id] = game.result()
+                result_cache.add(game.id, results[game.id])
+
+        # a game id that is missing or invalid is echoed as it was sent
+        return Response({'results': [
+            results[game_id] if game_id in results
+            else {'game_id': sent, 'error': ERROR_GAME_DOES_NOT_EXIST}
+            for sent, game_id in zip(requested, game_ids)]})
+
+
+class LeaderboardView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        limit = request.data.get('limit', LEADERBOARD_SIZE)
+        if (not isinstance(limit, (int, long)) or
+                limit < 1 or limit > MAX_LEADERBOARD_SIZE):
+            return Response({'error': ERROR_INVALID_LIMIT})
+
         try:
-            game = models.Game.objects.get(pk=request.data.get('game_id'))
-            score, frames = game.calculate_score()
+            since = parse_date_argument(request.data.get('since'))
+            until = parse_date_argument(request.data.get('until'))
+        except (TypeError, ValueError):
+            return Response({'error': ERROR_INVALID_DATE})
 
-            data = game.as_dict(score)
-            data['frames'] = [f.as_dict() for f in frames]
-            return Response(data)
-        except models.Game.DoesNotExist:
-            return Response({'error': ERROR_GAME_DOES_NOT_EXIST})
+        games = models.Game.leaderboard(limit, since, until)
+        return Response({'games': [game.as_leaderboard_dict()
+                                   for game in games]})
+
+
+# the games, newest first, page by page: next_cursor is passed as cursor
+# to get the next page and is None on the last one
+class GamesView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        limit = request.data.get('limit', GAMES_PAGE_SIZE)
+        if (not isinstance(limit, (int, long)) or
+                limit < 1 or limit > MAX_GAMES_PAGE_SIZE):
+            return Response({'error': ERROR_INVALID_LIMIT})
+
+        status = request.data.get('status')
+        if status is not None and status not in GAME_STATUSES:
+            return Response({'error': ERROR_INVALID_STATUS})
+
+        try:
+            before = parse_game_cursor(request.data.get('cursor'))
+        except (AttributeError, TypeError, ValueError):
+            return Response({'error': ERROR_INVALID_CURSOR})
+
+        # one game more tells whether there is a next page
+        games = models.Game.page(limit + 1, GAME_STATUSES.get(status), before)
+        next_cursor = game_cursor(games[limit - 1]) if len(games) > limit else None
+        return Response({'games': [game.as_summary_dict()
+                                   for game in games[:limit]],
+                         'next_cursor': next_cursor})
+
+
+def get_match(match_id):
+    return models.Match.objects.filter(pk=models.parse_game_id(match_id)).first()
+
+
+# a match with one game per bowler, in the order the bowlers are given
+class CreateMatchView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        bowlers = request.data.get('bowlers')
+        if (not isinstance(bowlers, list) or not bowlers or
+                not all(isinstance(bowler, basestring) and
+                        0 < len(bowler) <= MAX_BOWLER_NAME_LENGTH
+                        for bowler in bowlers)):
+            return Response({'error': ERROR_INVALID_BOWLERS})
+        if len(bowlers) > MAX_BOWLERS:
+            return Response({'error': ERROR_TOO_MANY_BOWLERS})
+
+        match = models.Match.create(bowlers)
+        return Response({'match_id': match.id, 'game_ids': [
+            game.id for game in match.games.order_by('position')]})
+
+
+# a roll of the bowler whose turn it is, answered with the game it went to
+class AddMatchScoreView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        match = get_match(request.data.get('match_id'))
+        if match is None:
+            return Response({'error': ERROR_MATCH_DOES_NOT_EXIST})
+
+        try:
+            game = match.add_score(request.data.get('score'))
+        except (models.InvalidScoreException, models.GameOverException,
+                models.ConcurrentUpdateException) as e:
+            return Response({'error': e.message})
+        return Response({'game_id': game.id})
+
+
+# the standings of all bowlers of a match and whose turn it is
+class MatchView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        match = get_match(request.data.get('match_id'))
+        if match is None:
+            return Response({'error': ERROR_MATCH_DOES_NOT_EXIST})
+        return Response(match.standings())
+
+
+# the statistics of the rolls made in [since, until), both days and
+# optional, and the distribution of all final scores
+class StatisticsView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        try:
+            since = parse_day_argument(request.data.get('since'))
+            until = parse_day_argument(request.data.get('until'))
+        except (TypeError, ValueError):
+            return Response({'error': ERROR_INVALID_DATE})
+
+        data = models.DailyStatistics.totals(since, until)
+        data.update(statistics.rates(data))
+        data['score_distribution'] = [
+            score.as_dict() for score in models.ScoreDistribution.objects.all()]
+        return Response(data)
+
+
+class ExportView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    content_types = {
+        'ndjson': 'application/x-ndjson',
+        'csv': 'text/csv',
+    }
+
+    # all games, streamed chunk by chunk
+    def post(self, request, format=None):
+        output_format = request.data.get('format', 'ndjson')
+        if output_format not in export.FORMATS:
+            return Response({'error': ERROR_INVALID_FORMAT})
+
+        after = models.parse_game_id(request.data.get('after')) or 0
+        response = StreamingHttpResponse(
+            export.export_lines(output_format, export.iter_games(after=after)),
+            content_type=self.content_types[output_format])
+        response['Content-Disposition'] = (
+            'attachment; filename="games.%s"' % output_format)
+        return response
+
+
+class ResultCacheStatsView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        return Response(result_cache.stats())
 
 
 class CreateGameView(APIView):
@@ -34,7 +361,7 @@ class CreateGameView(APIView):
     renderer_classes = (JSONRenderer, )
 
     def post(self, request, format=None):
-        game = models.Game.objects.create()
+        game = models.Game.create()
         return Response({'game_id': game.id})
 
 
@@ -47,8 +374,233 @@ class AddScoreView(APIView):
             game = models.Game.objects.get(pk=request.data.get('game_id'))
             game.add_score(request.data.get('score'))
             return Response()
-        except (models.InvalidScoreException, models.GameOverException) as e:
+        except (models.InvalidScoreException, models.GameOverException,
+                models.ConcurrentUpdateException) as e:
             return Response({'error': e.message})
         except models.Game.DoesNotExist:
-            return Response({'error': ERROR_GAME_DOES_NOT_EXIST})
+            return Response({'error': error_message(
+                models.missing_game_exception(request.data.get('game_id')))})
+
+
+# replace the roll at a position with another score
+class CorrectScoreView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        return change_roll(request.data, lambda game: game.correct_score(
+            request.data.get('position'), request.data.get('score')))
+
+
+# remove the roll at a position, the last roll without one
+class UndoScoreView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    def post(self, request, format=None):
+        return change_roll(request.data, lambda game: game.undo_score(
+            request.data.get('position')))
+
+
+# archived games are over and cannot be changed anymore
+def change_roll(data, change):
+    try:
+        game = models.Game.objects.get(pk=models.parse_game_id(data.get('game_id')))
+        change(game)
+        return Response()
+    except (models.InvalidScoreException, models.InvalidRollPositionException,
+            models.ConcurrentUpdateException) as e:
+        return Response({'error': e.message})
+    except models.Game.DoesNotExist:
+        return Response({'error': error_message(
+            models.missing_game_exception(data.get('game_id')))})
+
+
+# plain django versions of AddScoreView and GameResultView, used for
+# /api/add/ and /api/result/ with BOWLING_LEAN_VIEWS on
+# same requests and responses, but no content negotiation, parser and
+# renderer classes or DRF exception handling
+def lean_view(view):
+    @csrf_exempt
+    def post(request):
+        if request.method == 'OPTIONS':
+            response = _json_response(_metadata(view))
+            response['Allow'] = 'POST, OPTIONS'
+            return response
+        if request.method != 'POST':
+            response = _json_response(
+                {'detail': 'Method "%s" not allowed.' % request.method}, 405)
+            response['Allow'] = 'POST, OPTIONS'
+            return response
+
+        try:
+            data = _request_data(request)
+        except UnsupportedMediaType:
+            return _json_response({'detail': 'Unsupported media type "%s" '
+                                   'in request.' % request.META['CONTENT_TYPE']},
+                                  415)
+        except ValueError as e:
+            return _json_response({'detail': 'JSON parse error - %s' % e}, 400)
+        return _json_response(view(data))
+    return post
+
+
+# the answer to OPTIONS, as DRF's SimpleMetadata gives it for a view
+# class named like the function, AddScoreView for add_score
+def _metadata(view):
+    return OrderedDict([('name', view.__name__.replace('_', ' ').title()),
+                        ('description', ''),
+                        ('renders', ['application/json']),
+                        ('parses', list(PARSED_CONTENT_TYPES))])
+
+
+# the content types of DRF's default parsers, anything else with a body
+# is answered with 415 like DRF does
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+PARSED_CONTENT_TYPES = ('application/json', ) + FORM_CONTENT_TYPES
+
+
+class UnsupportedMediaType(Exception):
+    pass
+
+
+def _request_data(request):
+    if request.content_type in FORM_CONTENT_TYPES:
+        return request.POST
+    if not request.body:
+        return {}
+    if request.content_type != 'application/json':
+        raise UnsupportedMediaType()
+    return json.loads(request.body.decode(request.encoding or 'utf-8'))
+
+
+# rendered like JSONRenderer, an empty response without content type
+# for None
+def _json_response(data, status=200):
+    if data is None:
+        response = HttpResponse(status=status)
+        del response['Content-Type']
+        return response
+    return HttpResponse(json.dumps(data, separators=(',', ':')),
+                        content_type='application/json', status=status)
+
+
+@lean_view
+def add_score(data):
+    try:
+        game = models.Game.objects.get(pk=data.get('game_id'))
+        game.add_score(data.get('score'))
+    except (models.InvalidScoreException, models.GameOverException,
+            models.ConcurrentUpdateException) as e:
+        return {'error': e.message}
+    except models.Game.DoesNotExist:
+        return {'error': error_message(
+            models.missing_game_exception(data.get('game_id')))}
+
+
+@lean_view
+def game_result(data):
+    return game_result_response(data)
+
+
+# Server-Sent Events with the result of a game, GET /api/stream/?game_id=12
+# (EventSource only sends GET), the current result first and then every
+# new one as soon as it is committed, until the game is over or the
+# stream has been open BOWLING_STREAM_TIMEOUT seconds
+# every stream holds a worker thread, at most BOWLING_STREAM_MAX_SUBSCRIBERS
+# streams are served per process
+def stream_result(request):
+    if request.method != 'GET':
+        response = _json_response(
+            {'detail': 'Method "%s" not allowed.' % request.method}, 405)
+        response['Allow'] = 'GET'
+        return response
+
+    game_id = models.parse_game_id(request.GET.get('game_id'))
+    if game_id is None:
+        return _json_response({'error': ERROR_GAME_DOES_NOT_EXIST})
+
+    # subscribe before reading, a result committed in between is not lost
+    try:
+        subscription = pubsub.broker().subscribe(game_id)
+    except pubsub.TooManySubscribersException as e:
+        return _json_response({'error': e.message})
+
+    data = game_result_data(game_id)
+    # the stream does not use the database anymore, the connection would
+    # otherwise stay open until the stream ends
+    connection.close()
+    if data is None:
+        subscription.close()
+        return _json_response({'error': ERROR_GAME_DOES_NOT_EXIST})
+
+    # a reconnecting client sends the id of the last event it got
+    if request.META.get('HTTP_LAST_EVENT_ID') == str(data['version']):
+        data = None
+
+    response = StreamingHttpResponse(_ResultEvents(subscription, data),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+# the events of a stream, the subscription ends when the response is
+# closed, also if the client went away before the first event
+class _ResultEvents(object):
+
+    def __init__(self, subscription, data):
+        self.subscription = subscription
+        self.data = data
+
+    def __iter__(self):
+        keepalive = getattr(settings, 'BOWLING_STREAM_KEEPALIVE', 15)
+        closes = time.time() + getattr(settings, 'BOWLING_STREAM_TIMEOUT', 300)
+        data = self.data
+        while True:
+            if data is None:
+                yield ': keepalive\n\n'
+            else:
+                yield 'id: %d\nevent: result\ndata: %s\n\n' % (
+                    data['version'], json.dumps(data, separators=(',', ':')))
+                if data['is_over']:
+                    return
+
+            remaining = closes - time.time()
+            if remaining <= 0:
+                return
+            data = self.subscription.get(min(keepalive, remaining))
+
+    def close(self):
+        self.subscription.close()
+
+
+class AddManyScoresView(APIView):
+
+    renderer_classes = (JSONRenderer, )
+
+    # either {'game_id': 12, 'scores': [10, 3, 5]}
+    # or {'rolls': [{'game_id': 12, 'score': 10}, {'game_id': 13, 'score': 3}]}
+    def post(self, request, format=None):
+        rolls = request.data.get('rolls')
+        if rolls is None:
+            game_id = request.data.get('game_id')
+            scores = request.data.get('scores')
+            if isinstance(scores, list):
+                rolls = [{'game_id': game_id, 'score': score} for score in scores]
+
+        if not isinstance(rolls, list):
+            return Response({'error': ERROR_INVALID_ROLLS})
+        if len(rolls) > MAX_ROLLS_PER_REQUEST:
+            return Response({'error': ERROR_TOO_MANY_ROLLS})
+
+        try:
+            errors = models.add_scores(
+                [(roll.get('game_id'), roll.get('score')) if isinstance(roll, dict)
+                 else (None, None) for roll in rolls])
+        except models.ConcurrentUpdateException as e:
+            return Response({'error': e.message})
 
+        return Response({'errors': [
+            {'index': position, 'error': error_message(error)}
+            for position, error in errors]})
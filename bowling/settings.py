@@ -78,10 +78,58 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # a file, not sqlite's default in-memory test database, so the
+        # threads of the concurrency tests share it
+        'TEST': {
+            'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3'),
+        },
     }
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # /api/result/ payloads, use a shared cache (memcached, redis) when
+    # running several processes, the in-process cache is only refreshed
+    # by writes of the same process
+    'results': {
+        'BACKEND': 'api.cache.LRUCache',
+        'LOCATION': 'results',
+        'TIMEOUT': 30,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
+
+
+# Logging
+# https://docs.djangoproject.com/en/1.11/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        # request timings of api.middleware.TimingMiddleware
+        'api.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
@@ -119,3 +167,30 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/1.11/howto/static-files/
 
 STATIC_URL = '/static/'
+
+
+# Bowling
+
+# Keep the rolls of new games packed on the game row only instead of
+# writing one Frame row per frame, frames are derived when they are read
+BOWLING_PACKED_ROLLS = False
+
+# Cache (from CACHES) holding the /api/result/ payloads
+BOWLING_RESULT_CACHE = 'results'
+
+# Share of the requests api.middleware.TimingMiddleware records, the
+# middleware is off unless it is added to MIDDLEWARE
+BOWLING_TIMING_SAMPLE_RATE = 1.0
+
+# Serve /api/add/ and /api/result/ with the plain django views in
+# api.views instead of the DRF ones, same requests and responses
+BOWLING_LEAN_VIEWS = False
+
+# Publish/subscribe of new results for /api/stream/, the in-process
+# broker only reaches the streams of the same process
+BOWLING_BROKER = 'api.pubsub.LocalBroker'
+# Streams served at once per process, every stream holds a worker thread
+BOWLING_STREAM_MAX_SUBSCRIBERS = 100
+# Seconds a stream stays open and between keepalive comments
+BOWLING_STREAM_TIMEOUT = 300
+BOWLING_STREAM_KEEPALIVE = 15